@@ -0,0 +1,259 @@
+from abc import ABC, abstractmethod
+from collections import deque
+import asyncio
+import inspect
+import time
+
+from minidump_enums import *
+from minidump_presets import iter_fetch_ranges
+from minidump_writer import minidump_writer, unreadable_memory_error, _add_readable_part
+
+class async_minidump_provider(ABC):
+	"""
+	asyncio flavour of minidump_provider for remote and high latency memory sources.
+	the methods take and return the same values as their minidump_provider counterparts
+	"""
+	@abstractmethod
+	async def get_system_info(self):
+		"""
+		see minidump_provider.get_system_info
+		"""
+
+	async def take_snapshot(self):
+		return None
+
+	async def get_modules(self):
+		return []
+
+	async def get_memory_info(self):
+		return []
+
+	async def get_threads(self):
+		return {}
+
+	async def get_memory_descriptors(self):
+		return []
+
+	@abstractmethod
+	async def get_bytes(self, address, size, info):
+		"""
+		see minidump_provider.get_bytes, many calls are in flight at once (up to the writer's window)
+		"""
+
+	async def probe_readable(self, address, size, info):
+		return None
+
+class async_minidump_writer(minidump_writer):
+	"""
+	write() is a coroutine. up to window get_bytes calls are kept in flight, completed chunks are
+	written in file order at their computed offsets, so write-only sinks still work.
+	sync stream handlers registered in stream_to_handler keep working
+	"""
+	def __init__(self, file, chunk_size="auto", window=32, *args, **kwargs):
+		super().__init__(file, chunk_size, *args, **kwargs)
+		self.window = window
+
+		info_getter, translator, _ = self.stream_to_handler[MINIDUMP_STREAM_TYPE.Memory64ListStream.value]
+		self.stream_to_handler[MINIDUMP_STREAM_TYPE.Memory64ListStream.value] = (info_getter, translator, self.async_memory_fetcher)
+
+	async def plan(self):
+		"""
+		see minidump_writer.plan, the provider getters are awaited
+		"""
+		self._begin_plan()
+		self.snapshot = await _maybe_await(self.take_snapshot())
+		try:
+			self.write_header()
+			self.write_directories_header()
+			headers_size = self._end_rva
+
+			stream_infos = []
+			for directory in self.directories:
+				info_getter, _, _ = self.stream_to_handler[directory.StreamType]
+				getter_start = time.perf_counter()
+				stream_infos.append(await _maybe_await(info_getter()))
+				if self.instrumentation is not None:
+					self.instrumentation.record_stream(directory.StreamType, "enumerate", time.perf_counter() - getter_start)
+
+			self._plan_streams(stream_infos)
+		finally:
+			self.snapshot = None
+
+		return self._plan_result(headers_size)
+
+	async def write(self):
+		self._begin_write()
+		self.snapshot = await _maybe_await(self.take_snapshot())
+		try:
+			self.write_header()
+			self.write_directories_header()
+
+			stream_infos = []
+			for directory in self.directories:
+				info_getter, _, _ = self.stream_to_handler[directory.StreamType]
+				getter_start = time.perf_counter()
+				stream_infos.append(await _maybe_await(info_getter()))
+				if self.instrumentation is not None:
+					self.instrumentation.record_stream(directory.StreamType, "enumerate", time.perf_counter() - getter_start)
+
+			if self.thread_stacks:
+				for thread_id, stack_start, stack_size, info in self._resolve_thread_stacks(stream_infos):
+					self._thread_stacks[thread_id] = (stack_start, stack_size, await self._get_bytes_exact(stack_start, stack_size, info))
+
+			self._select_memory(stream_infos)
+			if self.probe_memory:
+				await self._probe_memory(stream_infos)
+
+			self._lay_out_streams(stream_infos)
+
+			for directory, info in zip(self.directories, stream_infos):
+				_, _, post_translator = self.stream_to_handler[directory.StreamType]
+				if post_translator:
+					post_start = time.perf_counter()
+					await _maybe_await(post_translator(info, directory))
+					if self.instrumentation is not None:
+						self.instrumentation.record_stream(directory.StreamType, "post", time.perf_counter() - post_start)
+
+			self._finish_write()
+		finally:
+			self.snapshot = None
+			self._close_journal()
+			self._unmap_output()
+			self._abort_encoders()
+
+	async def _get_bytes_exact(self, address, size, info, salvage=True):
+		read_start = time.perf_counter()
+		try:
+			buffer = await self.get_bytes(address, size, info)
+			while len(buffer) < size:
+				# providers may return less than asked for, the rest is read before the chunk is written
+				buffer = bytes(buffer) + await self.get_bytes(address + len(buffer), size - len(buffer), info)
+		except unreadable_memory_error:
+			if not salvage:
+				raise
+
+			return await self._salvage_chunk(address, size, info)
+
+		# includes the time spent waiting behind the other reads of the window
+		if self.instrumentation is not None:
+			self.instrumentation.record_read(time.perf_counter() - read_start, size)
+
+		if self.throttle is not None:
+			self.throttle.record_read(time.perf_counter() - read_start, size)
+
+		# the parts read again while salvaging are too small to say anything about the chunk size
+		if self._chunk_size_tuner is not None and salvage:
+			self._chunk_size_tuner.record(size, time.perf_counter() - read_start)
+
+		return buffer
+
+	async def _salvage_chunk(self, address, size, info):
+		buffer = self._begin_salvage(size)
+		async for part_address, part_size, data in self._read_salvaging(address, size, info):
+			self._salvaged_part(buffer, address, part_address, part_size, data)
+
+		return buffer
+
+	async def _read_salvaging(self, address, size, info):
+		# see minidump_writer._read_salvaging
+		pending = [(address, size)]
+		while pending:
+			part_address, part_size = pending.pop()
+			try:
+				data = await self._get_bytes_exact(part_address, part_size, info, salvage=False)
+			except unreadable_memory_error:
+				if not self._split_failed_part(pending, part_address, part_size):
+					yield part_address, part_size, None
+
+				continue
+
+			yield part_address, part_size, data
+
+	async def _probe_memory(self, stream_infos):
+		memory_index = self._memory_stream_index()
+		if memory_index is None:
+			return
+
+		ranges = list(iter_fetch_ranges(stream_infos[memory_index]))
+		readable_parts = []
+		for range_start, range_size, info in ranges:
+			range_readable_parts = await self.probe_readable(range_start, range_size, info)
+			if range_readable_parts is None:
+				range_readable_parts = await self._readable_parts(range_start, range_size, info)
+
+			readable_parts.append(range_readable_parts)
+
+		stream_infos[memory_index] = self._probed_descriptors(ranges, readable_parts)
+
+	async def _readable_parts(self, address, size, info):
+		readable_parts = []
+		for chunk_address, chunk_size in self._probe_chunks(address, size):
+			if self.throttle is not None:
+				await self._throttle(chunk_size)
+
+			async for part_address, part_size, data in self._read_salvaging(chunk_address, chunk_size, info):
+				_add_readable_part(readable_parts, part_address, part_size, data)
+
+		return readable_parts
+
+	async def async_memory_fetcher(self, memory_descriptors, directory):
+		current_disk_rva = self._memory64_list_struct.BaseRva
+		in_flight = deque()
+
+		try:
+			for range_start, range_size, info, disk_rva in self._payload_ranges(memory_descriptors, current_disk_rva):
+				range_offset = 0
+				while range_offset < range_size:
+					amount_bytes_to_read = self._next_chunk_size(range_size - range_offset)
+					if self.throttle is not None:
+						await self._throttle(amount_bytes_to_read)
+
+					if self.io_scheduler is not None:
+						await self._acquire_in_flight(amount_bytes_to_read, in_flight)
+
+					read_task = asyncio.ensure_future(self._get_bytes_exact(range_start + range_offset, amount_bytes_to_read, info))
+					in_flight.append((disk_rva + range_offset, amount_bytes_to_read, read_task))
+
+					range_offset += amount_bytes_to_read
+					if len(in_flight) >= self.window:
+						await self._write_completed(*in_flight.popleft())
+
+			while in_flight:
+				await self._write_completed(*in_flight.popleft())
+		finally:
+			for _, amount_bytes_to_read, read_task in in_flight:
+				read_task.cancel()
+				if self.io_scheduler is not None:
+					self.io_scheduler.release(amount_bytes_to_read)
+
+	async def _throttle(self, amount_bytes_to_read):
+		delay = self.throttle.reserve(amount_bytes_to_read)
+		if self.throttle.yield_interval is not None:
+			# the pause between chunks, sleep(0) only lets the other tasks run
+			delay = max(delay, self.throttle.yield_interval)
+
+		await asyncio.sleep(delay)
+
+	async def _acquire_in_flight(self, amount_bytes_to_read, in_flight):
+		# the chunks in flight hold part of the budget, they are written first so the window never waits on itself
+		while in_flight and not self.io_scheduler.acquire(amount_bytes_to_read, blocking=False):
+			await self._write_completed(*in_flight.popleft())
+
+		if not in_flight:
+			# the scheduler is shared with other processes and blocks, the event loop keeps running meanwhile
+			await asyncio.to_thread(self.io_scheduler.acquire, amount_bytes_to_read)
+
+	async def _write_completed(self, disk_rva, amount_bytes_to_read, read_task):
+		try:
+			buffer = await read_task
+			# the reads behind this one keep going while the chunk is written
+			await asyncio.to_thread(self._write_at, disk_rva, buffer)
+		finally:
+			if self.io_scheduler is not None:
+				self.io_scheduler.release(amount_bytes_to_read)
+
+async def _maybe_await(result):
+	if inspect.isawaitable(result):
+		return await result
+
+	return result
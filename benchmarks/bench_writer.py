@@ -0,0 +1,268 @@
+"""
+throughput benchmark for minidump_writer.write()
+
+every case runs in its own subprocess so peak RSS is per case. results are stored as JSON and
+can be compared against a previous run:
+
+	python benchmarks/bench_writer.py --output new.json --compare old.json
+	python benchmarks/bench_writer.py --regions 1000 1000000 --memory 16M 32G --density sparse --sink null
+"""
+from array import array
+import argparse
+import itertools
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from minidump_writer import minidump_provider, minidump_writer
+
+PAGE_SIZE = 0x1000
+PATTERN_SIZE = 0x100000
+
+size_suffixes = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+
+def parse_size(size):
+	if size[-1].upper() in size_suffixes:
+		return int(float(size[:-1]) * size_suffixes[size[-1].upper()])
+
+	return int(size)
+
+def parse_chunk_size(chunk_size):
+	# "auto" lets the writer tune the chunk size, -1 reads whole ranges
+	if chunk_size == "auto":
+		return chunk_size
+
+	return parse_size(chunk_size)
+
+class synthetic_writer(minidump_provider, minidump_writer):
+	"""
+	synthetic process, regions split total_memory evenly (page aligned).
+	sparse memory returns zero pages for every other page, dense memory never returns zero pages.
+	get_bytes hands out slices of a preallocated pattern so the provider cost stays out of the numbers
+	"""
+	def __init__(self, file, regions, modules, threads, total_memory, sparse_memory, columnar, *args, **kwargs):
+		self.regions = regions
+		self.modules = modules
+		self.threads = threads
+		self.columnar = columnar
+		self.region_size = max(PAGE_SIZE, (total_memory // regions) // PAGE_SIZE * PAGE_SIZE)
+
+		pattern = bytearray(os.urandom(PATTERN_SIZE))
+		if sparse_memory:
+			for page_offset in range(0, PATTERN_SIZE, 2 * PAGE_SIZE):
+				pattern[page_offset:page_offset + PAGE_SIZE] = bytes(PAGE_SIZE)
+		else:
+			# make sure no page of the random pattern happens to be all zero
+			for page_offset in range(0, PATTERN_SIZE, PAGE_SIZE):
+				pattern[page_offset] = 1
+
+		self.pattern = memoryview(bytes(pattern * 2))
+		super().__init__(file, *args, **kwargs)
+
+	def get_system_info(self):
+		return {"ProcessorArchitecture": "amd64", "MajorVersion": 10, "MinorVersion": 0, "BuildNumber": 19045}
+
+	def get_modules(self):
+		return [{"BaseOfImage": 0x7ff000000000 + module_index * 0x100000, "SizeOfImage": 0x100000, "ModuleName": f"c:\\windows\\system32\\module_{module_index}.dll"} for module_index in range(self.modules)]
+
+	def get_threads(self):
+		return {0x100 + thread_index * 4: {"Teb": 0x7f0000000000 + thread_index * 0x2000, "Context": {"Rip": 0x7ff000001000, "Rsp": 0x10000000 + thread_index * 0x100000}} for thread_index in range(self.threads)}
+
+	def _region_starts(self):
+		# leave a page between regions so nothing is adjacent
+		return array("Q", range(0x10000, 0x10000 + self.regions * (self.region_size + PAGE_SIZE), self.region_size + PAGE_SIZE))
+
+	def get_memory_info(self):
+		if self.columnar:
+			return {"BaseAddress": self._region_starts(), "RegionSize": array("Q", [self.region_size]) * self.regions, "Protect": array("I", [0x04]) * self.regions, "AllocationProtect": array("I", [0x04]) * self.regions}
+
+		return [{"BaseAddress": region_start, "RegionSize": self.region_size, "Protect": "rw-", "AllocationProtect": "rw-"} for region_start in self._region_starts()]
+
+	def get_memory_descriptors(self):
+		if self.columnar:
+			return {"BaseAddress": self._region_starts(), "RegionSize": array("Q", [self.region_size]) * self.regions}
+
+		return [(region_start, self.region_size, None) for region_start in self._region_starts()]
+
+	def get_bytes(self, address, size, info):
+		pattern_offset = address % PATTERN_SIZE
+		if size <= PATTERN_SIZE:
+			return self.pattern[pattern_offset:pattern_offset + size]
+
+		return bytes(self.pattern[pattern_offset:pattern_offset + PATTERN_SIZE]) * (size // PATTERN_SIZE) + bytes(self.pattern[pattern_offset:pattern_offset + size % PATTERN_SIZE])
+
+class counting_file:
+	"""
+	forwards to the real file and counts the calls the writer makes on it
+	"""
+	def __init__(self, file):
+		self._file = file
+		self.calls = {"write": 0, "seek": 0, "truncate": 0, "flush": 0}
+
+	def write(self, buffer):
+		self.calls["write"] += 1
+		return self._file.write(buffer)
+
+	def seek(self, *args):
+		self.calls["seek"] += 1
+		return self._file.seek(*args)
+
+	def truncate(self, *args):
+		self.calls["truncate"] += 1
+		return self._file.truncate(*args)
+
+	def flush(self):
+		self.calls["flush"] += 1
+		return self._file.flush()
+
+	def seekable(self):
+		return self._file.seekable()
+
+	def fileno(self):
+		return self._file.fileno()
+
+def run_case(case):
+	"""
+	runs a single case in this process and returns its metrics
+	"""
+	if case["sink"] == "null":
+		output_path = os.devnull
+	else:
+		output_fd, output_path = tempfile.mkstemp(suffix=".dmp", dir=case["output_dir"])
+		os.close(output_fd)
+
+	translator_times = {}
+	pwrite_calls = [0]
+	original_pwrite = os.pwrite if hasattr(os, "pwrite") else None
+
+	def counting_pwrite(*args):
+		pwrite_calls[0] += 1
+		return original_pwrite(*args)
+
+	try:
+		with open(output_path, "wb") as output_file:
+			sink = counting_file(output_file)
+			writer = synthetic_writer(sink, case["regions"], case["modules"], case["threads"], case["memory"], case["density"] == "sparse", case["columnar"],
+				chunk_size=case["chunk_size"], fetch_threads=case["fetch_threads"], sparse=case["sparse_output"])
+
+			for stream_type, (info_getter, translator, post_translator) in list(writer.stream_to_handler.items()):
+				def timed_translator(info, translator=translator, stream_type=stream_type):
+					translator_start = time.perf_counter()
+					location = translator(info)
+					translator_times[stream_type] = time.perf_counter() - translator_start
+					return location
+
+				writer.stream_to_handler[stream_type] = (info_getter, timed_translator, post_translator)
+
+			if original_pwrite is not None:
+				os.pwrite = counting_pwrite
+
+			write_start = time.perf_counter()
+			writer.write()
+			wall_time = time.perf_counter() - write_start
+	finally:
+		if original_pwrite is not None:
+			os.pwrite = original_pwrite
+
+		output_size = os.path.getsize(output_path) if output_path != os.devnull else None
+		if output_path != os.devnull:
+			os.unlink(output_path)
+
+	payload_size = writer.regions * writer.region_size
+	# ru_maxrss is KiB on Linux and bytes on macOS
+	peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	if sys.platform != "darwin":
+		peak_rss *= 1024
+
+	return {
+		"wall_time": wall_time,
+		"payload_bytes": payload_size,
+		"output_bytes": output_size,
+		"mb_per_second": payload_size / wall_time / (1 << 20) if wall_time else None,
+		"translator_times": {str(stream_type): translator_time for stream_type, translator_time in translator_times.items()},
+		"file_calls": dict(sink.calls, pwrite=pwrite_calls[0]),
+		"sparse_bytes_skipped": writer.sparse_bytes_skipped,
+		"peak_rss": peak_rss,
+	}
+
+def case_key(case):
+	return json.dumps({key: value for key, value in case.items() if key != "output_dir"}, sort_keys=True)
+
+def run_case_subprocess(case):
+	completed = subprocess.run([sys.executable, os.path.abspath(__file__), "--single", json.dumps(case)], stdout=subprocess.PIPE, check=True)
+	return json.loads(completed.stdout)
+
+def compare(results, baseline_path):
+	with open(baseline_path, "r") as baseline_file:
+		baseline = {case_key(result["case"]): result["metrics"] for result in json.load(baseline_file)["results"]}
+
+	for result in results:
+		old_metrics = baseline.get(case_key(result["case"]), None)
+		if old_metrics is None:
+			continue
+
+		new_metrics = result["metrics"]
+		print(f"{describe(result['case'])}: wall {old_metrics['wall_time']:.3f}s -> {new_metrics['wall_time']:.3f}s "
+			f"({new_metrics['wall_time'] / old_metrics['wall_time']:.2f}x), peak rss {old_metrics['peak_rss'] >> 20}M -> {new_metrics['peak_rss'] >> 20}M")
+
+def describe(case):
+	return f"regions={case['regions']} memory={case['memory'] >> 20}M {case['density']} threads={case['fetch_threads']} chunk={case.get('chunk_size', 0x10000)} columnar={case['columnar']} sparse_output={case['sparse_output']}"
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--regions", nargs="+", type=int, default=[1000, 10000, 100000])
+	parser.add_argument("--memory", nargs="+", type=parse_size, default=[parse_size("64M"), parse_size("1G")])
+	parser.add_argument("--density", nargs="+", choices=["dense", "sparse"], default=["dense", "sparse"])
+	parser.add_argument("--modules", type=int, default=200)
+	parser.add_argument("--threads", type=int, default=100)
+	parser.add_argument("--fetch-threads", nargs="+", type=int, default=[0])
+	parser.add_argument("--chunk-size", type=parse_chunk_size, default="auto", help="bytes per provider read, auto (the writer's default) or -1 for whole ranges")
+	parser.add_argument("--columnar", nargs="+", type=int, choices=[0, 1], default=[0])
+	parser.add_argument("--sparse-output", nargs="+", type=int, choices=[0, 1], default=[0])
+	parser.add_argument("--sink", choices=["file", "null"], default="file", help="null writes to os.devnull to take the disk out")
+	parser.add_argument("--output-dir", default=None, help="directory for the temporary dumps")
+	parser.add_argument("--output", default="bench_results.json")
+	parser.add_argument("--compare", default=None, help="previous results to compare against")
+	parser.add_argument("--single", default=None, help=argparse.SUPPRESS)
+	args = parser.parse_args()
+
+	if args.single is not None:
+		json.dump(run_case(json.loads(args.single)), sys.stdout)
+		return
+
+	results = []
+	for regions, memory, density, fetch_threads, columnar, sparse_output in itertools.product(args.regions, args.memory, args.density, args.fetch_threads, args.columnar, args.sparse_output):
+		case = {
+			"regions": regions,
+			"memory": memory,
+			"density": density,
+			"modules": args.modules,
+			"threads": args.threads,
+			"fetch_threads": fetch_threads,
+			"chunk_size": args.chunk_size,
+			"columnar": bool(columnar),
+			"sparse_output": bool(sparse_output),
+			"sink": args.sink,
+			"output_dir": args.output_dir,
+		}
+
+		metrics = run_case_subprocess(case)
+		results.append({"case": case, "metrics": metrics})
+		print(f"{describe(case)}: {metrics['wall_time']:.3f}s {metrics['mb_per_second']:.1f} MB/s "
+			f"writes={metrics['file_calls']['write']} seeks={metrics['file_calls']['seek']} pwrites={metrics['file_calls']['pwrite']} peak_rss={metrics['peak_rss'] >> 20}M")
+
+	with open(args.output, "w") as output_file:
+		json.dump({"python": sys.version, "platform": platform.platform(), "time": time.time(), "results": results}, output_file, indent=1)
+
+	if args.compare is not None:
+		compare(results, args.compare)
+
+if __name__ == "__main__":
+	main()
@@ -1,5 +1,6 @@
 from minidump_enums import *
 from minidump_writer import minidump_provider, minidump_writer
+import sys
 
 class dummy_writer(minidump_provider, minidump_writer):
 	def __init__(self, *args, **kwargs):
@@ -78,7 +79,17 @@ class dummy_writer(minidump_provider, minidump_writer):
 		return size * b"\x55"
 
 def main():
-	with open("dummy_writer.dmp", "wb+") as f:
+	output_path = "dummy_writer.dmp"
+	if len(sys.argv) > 1:
+		output_path = sys.argv[1]
+
+	# "-" streams the dump to stdout, e.g. `python dummy_writer.py - | gzip > dummy_writer.dmp.gz`
+	if output_path == "-":
+		test_writer = dummy_writer(sys.stdout.buffer)
+		test_writer.write()
+		return
+
+	with open(output_path, "wb") as f:
 		test_writer = dummy_writer(f)
 		test_writer.write()
 
@@ -0,0 +1,297 @@
+from minidump_enums import *
+from minidump_writer import minidump_provider, minidump_writer
+import os
+import struct
+import sys
+
+PT_LOAD = 1
+PT_NOTE = 4
+PN_XNUM = 0xffff
+
+PF_X = 1
+PF_W = 2
+PF_R = 4
+
+NT_PRSTATUS = 1
+NT_FILE = 0x46494c45
+
+EM_386 = 3
+EM_ARM = 40
+EM_X86_64 = 62
+EM_AARCH64 = 183
+
+machine_to_arch = {
+	EM_386: "intel",
+	EM_ARM: "arm",
+	EM_X86_64: "amd64",
+	EM_AARCH64: "arm64",
+}
+
+# elf_gregset_t order of user_regs_struct, None for registers CONTEXT has no room for
+x86_64_gregs = ["R15", "R14", "R13", "R12", "Rbp", "Rbx", "R11", "R10", "R9", "R8", "Rax", "Rcx", "Rdx", "Rsi", "Rdi", None,
+	"Rip", "SegCs", "EFlags", "Rsp", "SegSs", None, None, "SegDs", "SegEs", "SegFs", "SegGs"]
+i386_gregs = ["Ebx", "Ecx", "Edx", "Esi", "Edi", "Ebp", "Eax", "SegDs", "SegEs", "SegFs", "SegGs", None,
+	"Eip", "SegCs", "EFlags", "Esp", "SegSs"]
+aarch64_gregs = [f"X{register_index}" for register_index in range(29)] + ["Fp", "Lr", "Sp", "Pc", "Cpsr"]
+
+# CONTEXT_AMD64 / CONTEXT_i386 | CONTEXT_CONTROL | CONTEXT_INTEGER | CONTEXT_SEGMENTS
+CONTEXT64_FLAGS = 0x100007
+CONTEXT32_FLAGS = 0x10007
+# CONTEXT_ARM64 | CONTEXT_CONTROL | CONTEXT_INTEGER
+CONTEXT_ARM64_FLAGS = 0x400003
+
+# (header format, program header format, program header field order, prstatus pid offset, prstatus registers offset, word format)
+elf_class_layout = {
+	1: ("<16sHHIIIIIHHHHHH", "<IIIIIIII", ("p_type", "p_offset", "p_vaddr", "p_paddr", "p_filesz", "p_memsz", "p_flags", "p_align"), 24, 72, "I"),
+	2: ("<16sHHIQQQIHHHHHH", "<IIQQQQQQ", ("p_type", "p_flags", "p_offset", "p_vaddr", "p_paddr", "p_filesz", "p_memsz", "p_align"), 32, 112, "Q"),
+}
+
+def flags_to_protect_string(flags):
+	to_return = ""
+	to_return += "r" if flags & PF_R else "-"
+	to_return += "w" if flags & PF_W else "-"
+	to_return += "x" if flags & PF_X else "-"
+
+	return to_return
+
+class elf_core_writer(minidump_provider, minidump_writer):
+	"""
+	converts an ELF core file. PT_LOAD segments are moved into the dump with copy_file_range / sendfile.
+	the core is closed once write() finishes, or with close() / a with block
+	"""
+	def __init__(self, file, core_path, *args, **kwargs):
+		self.core_path = core_path
+		self._core_fd = None
+		self._core_size = os.fstat(self._core()).st_size
+		try:
+			self._parse_core()
+		except BaseException:
+			self.close()
+			raise
+
+		super().__init__(file, *args, **kwargs)
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.close()
+
+	def close(self):
+		if self._core_fd is not None:
+			os.close(self._core_fd)
+			self._core_fd = None
+
+	def write(self):
+		try:
+			return super().write()
+		finally:
+			self.close()
+
+	def _core(self):
+		# opened again when the writer is reused after close()
+		if self._core_fd is None:
+			self._core_fd = os.open(self.core_path, os.O_RDONLY)
+
+		return self._core_fd
+
+	def _read_core(self, offset, size):
+		return os.pread(self._core(), size, offset)
+
+	def _parse_core(self):
+		elf_header = self._read_core(0, 0x40)
+		if elf_header[:4] != b"\x7fELF":
+			raise ValueError("Not an ELF file")
+
+		if elf_header[5] != 1:
+			raise ValueError("Only little endian core files are supported")
+
+		header_format, program_header_format, program_header_fields, pid_offset, registers_offset, word_format = elf_class_layout[elf_header[4]]
+		self._word_format = word_format
+		self._prstatus_pid_offset = pid_offset
+		self._prstatus_registers_offset = registers_offset
+
+		_, e_type, self.machine, _, _, e_phoff, e_shoff, _, _, e_phentsize, e_phnum, e_shentsize, _, _ = struct.unpack_from(header_format, elf_header)
+		if e_phnum == PN_XNUM:
+			# the real count lives in sh_info of the first section header
+			section_header = self._read_core(e_shoff, e_shentsize)
+			e_phnum = struct.unpack_from("<I", section_header, 44 if word_format == "Q" else 28)[0]
+
+		program_headers = self._read_core(e_phoff, e_phentsize * e_phnum)
+
+		# (vaddr, memsz, filesz, offset, flags)
+		self.segments = []
+		self.threads = {}
+		self.mapped_files = []
+		for program_header_index in range(e_phnum):
+			fields = struct.unpack_from(program_header_format, program_headers, program_header_index * e_phentsize)
+			program_header = dict(zip(program_header_fields, fields))
+
+			if program_header["p_type"] == PT_LOAD:
+				self.segments.append((program_header["p_vaddr"], program_header["p_memsz"], program_header["p_filesz"], program_header["p_offset"], program_header["p_flags"]))
+			elif program_header["p_type"] == PT_NOTE:
+				self._parse_notes(self._read_core(program_header["p_offset"], program_header["p_filesz"]))
+
+	def _parse_notes(self, notes):
+		note_offset = 0
+		while note_offset + 12 <= len(notes):
+			name_size, description_size, note_type = struct.unpack_from("<III", notes, note_offset)
+			description_offset = note_offset + 12 + ((name_size + 3) & ~3)
+			description = notes[description_offset:description_offset + description_size]
+			note_offset = description_offset + ((description_size + 3) & ~3)
+
+			if note_type == NT_PRSTATUS:
+				self._parse_prstatus(description)
+			elif note_type == NT_FILE:
+				self._parse_file_note(description)
+
+	def _parse_prstatus(self, prstatus):
+		thread_id = struct.unpack_from("<I", prstatus, self._prstatus_pid_offset)[0]
+		thread_info = {}
+
+		register_names = None
+		if self.machine == EM_X86_64:
+			register_names = x86_64_gregs
+			thread_info["Context"] = {"ContextFlags": CONTEXT64_FLAGS}
+		elif self.machine == EM_386:
+			register_names = i386_gregs
+			thread_info["Context"] = {"ContextFlags": CONTEXT32_FLAGS}
+		elif self.machine == EM_AARCH64:
+			register_names = aarch64_gregs
+			thread_info["Context"] = {"ContextFlags": CONTEXT_ARM64_FLAGS}
+
+		if register_names is not None:
+			registers = struct.unpack_from(f"<{len(register_names)}{self._word_format}", prstatus, self._prstatus_registers_offset)
+			for register_name, register_value in zip(register_names, registers):
+				if register_name is not None:
+					thread_info["Context"][register_name] = register_value
+
+		self.threads[thread_id] = thread_info
+
+	def _parse_file_note(self, file_note):
+		word_size = struct.calcsize(self._word_format)
+		count, _ = struct.unpack_from(f"<2{self._word_format}", file_note)
+		ranges = struct.unpack_from(f"<{count * 3}{self._word_format}", file_note, 2 * word_size)
+		names = file_note[(2 + count * 3) * word_size:].split(b"\x00")
+
+		for range_index in range(count):
+			start, end, _ = ranges[range_index * 3:range_index * 3 + 3]
+			self.mapped_files.append((start, end, names[range_index].decode(errors="replace")))
+
+	def _modules_by_path(self):
+		modules = {}
+		for start, end, path in self.mapped_files:
+			if path in modules:
+				modules[path][1] = max(modules[path][1], end)
+			else:
+				modules[path] = [start, end]
+
+		# every mapped file with an executable segment is treated as a module spanning all of its mappings
+		executable_segments = [(vaddr, vaddr + memsz) for vaddr, memsz, _, _, flags in self.segments if flags & PF_X]
+		for path in list(modules):
+			module_start, module_end = modules[path]
+			if not any(segment_start < module_end and module_start < segment_end for segment_start, segment_end in executable_segments):
+				del modules[path]
+
+		return modules
+
+	def get_system_info(self):
+		to_return = {}
+		to_return["ProcessorArchitecture"] = machine_to_arch.get(self.machine, "unknown")
+		to_return["MajorVersion"] = 0
+		to_return["MinorVersion"] = 0
+		to_return["BuildNumber"] = 0
+		to_return["PlatformId"] = PlatformId.VER_PLATFORM_LINUX.value
+
+		return to_return
+
+	def get_modules(self):
+		list_of_modules = []
+		for path, (start, end) in self._modules_by_path().items():
+			current_module = {}
+			current_module["BaseOfImage"] = start
+			current_module["SizeOfImage"] = end - start
+			current_module["ModuleName"] = path
+			list_of_modules.append(current_module)
+
+		return list_of_modules
+
+	def get_threads(self):
+		return self.threads
+
+	def get_memory_info(self):
+		memory_info = []
+		modules = self._modules_by_path()
+		mapped_files = {}
+		for start, end, path in self.mapped_files:
+			mapped_files[start] = path
+
+		for vaddr, memsz, filesz, offset, flags in self.segments:
+			info = {}
+			info["BaseAddress"] = vaddr
+			info["RegionSize"] = memsz
+			info["Protect"] = flags_to_protect_string(flags)
+			info["AllocationProtect"] = info["Protect"]
+
+			path = mapped_files.get(vaddr, None)
+			if path in modules:
+				info["Type"] = "Image"
+				info["AllocationBase"] = modules[path][0]
+			elif path is not None:
+				info["Type"] = "Mapped"
+			else:
+				info["Type"] = "Private"
+
+			memory_info.append(info)
+
+		return memory_info
+
+	def get_memory_descriptors(self):
+		memory_descriptors_arr = []
+		for segment in self.segments:
+			vaddr, memsz, filesz, offset, flags = segment
+			# segments the kernel chose not to dump have no file data
+			if filesz == 0:
+				continue
+
+			memory_descriptors_arr.append((vaddr, filesz, segment))
+
+		return memory_descriptors_arr
+
+	def get_file_backing(self, address, size, info):
+		vaddr, memsz, filesz, offset, flags = info
+		file_offset = offset + (address - vaddr)
+		# truncated core files are read and zero filled instead
+		if file_offset + size > self._core_size:
+			return None
+
+		return self._core(), file_offset
+
+	def get_bytes_into(self, address, buffer, info):
+		vaddr, memsz, filesz, offset, flags = info
+		amount_read = os.preadv(self._core(), [buffer], offset + (address - vaddr))
+		buffer[amount_read:] = bytes(len(buffer) - amount_read)
+
+		return len(buffer)
+
+	def get_bytes(self, address, size, info):
+		vaddr, memsz, filesz, offset, flags = info
+		return self._read_core(offset + (address - vaddr), size).ljust(size, b"\x00")
+
+def main():
+	core_path = sys.argv[1]
+	output_path = core_path + ".dmp"
+	if len(sys.argv) > 2:
+		output_path = sys.argv[2]
+
+	# "-" streams the dump to stdout so it can be piped without a temporary file
+	if output_path == "-":
+		with elf_core_writer(sys.stdout.buffer, core_path) as test_writer:
+			test_writer.write()
+		return
+
+	with open(output_path, "wb") as f, elf_core_writer(f, core_path) as test_writer:
+		test_writer.write()
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,339 @@
+from minidump_enums import *
+from minidump_writer import minidump_provider, minidump_writer
+import ctypes
+import errno
+import os
+import platform
+import re
+import sys
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+IOV_MAX = os.sysconf("SC_IOV_MAX")
+
+# kernel provided mappings that can't be read through process_vm_readv or /proc/<pid>/mem
+UNREADABLE_MAPPINGS = ["[vvar]", "[vvar_vclock]", "[vsyscall]"]
+
+# probe_readable reads ranges through a buffer of this size
+PROBE_SCRATCH_SIZE = 0x100000
+
+machine_to_arch = {
+	"x86_64": "amd64",
+	"i386": "intel",
+	"i686": "intel",
+	"aarch64": "arm64",
+	"armv7l": "arm",
+}
+
+class iovec(ctypes.Structure):
+	_fields_ = [
+		("iov_base", ctypes.c_void_p),
+		("iov_len", ctypes.c_size_t),
+	]
+
+_libc = ctypes.CDLL(None, use_errno=True)
+_process_vm_readv = getattr(_libc, "process_vm_readv", None)
+if _process_vm_readv is not None:
+	_process_vm_readv.argtypes = [ctypes.c_int, ctypes.POINTER(iovec), ctypes.c_ulong, ctypes.POINTER(iovec), ctypes.c_ulong, ctypes.c_ulong]
+	_process_vm_readv.restype = ctypes.c_ssize_t
+
+def parse_maps(pid):
+	"""
+	returns (start, end, perms, offset, inode, path) for every line of /proc/<pid>/maps
+	"""
+	mappings = []
+	with open(f"/proc/{pid}/maps", "r") as maps_file:
+		for line in maps_file:
+			fields = line.split(None, 5)
+			start, end = fields[0].split("-")
+			path = fields[5].strip() if len(fields) > 5 else ""
+			mappings.append((int(start, 16), int(end, 16), fields[1], int(fields[2], 16), int(fields[4]), path))
+
+	return mappings
+
+class linux_writer(minidump_provider, minidump_writer):
+	def __init__(self, file, pid=None, *args, **kwargs):
+		self.pid = pid
+		if self.pid is None:
+			self.pid = os.getpid()
+
+		self._mem_fd = None
+		self._use_process_vm_readv = _process_vm_readv is not None
+		super().__init__(file, *args, **kwargs)
+
+	def write(self):
+		try:
+			return super().write()
+		finally:
+			self.close()
+
+	def close(self):
+		"""
+		closes /proc/<pid>/mem, the next read opens it again
+		"""
+		if self._mem_fd is not None:
+			os.close(self._mem_fd)
+			self._mem_fd = None
+
+	def take_snapshot(self):
+		# modules, memory info and descriptors all come from the same read of /proc/<pid>/maps
+		return parse_maps(self.pid)
+
+	def _mappings(self):
+		if self.snapshot is not None:
+			return self.snapshot
+
+		return parse_maps(self.pid)
+
+	def get_system_info(self):
+		to_return = {}
+		uname = os.uname()
+		to_return["ProcessorArchitecture"] = machine_to_arch.get(platform.machine(), "unknown")
+		to_return["ProcessorLevel"] = ProcessorLevel.INTEL_PRO_OR_PENTIUM_2.value
+		to_return["ProcessorRevision"] = 0x5E03
+
+		kernel_version = [int(number) for number in re.findall(r"\d+", uname.release)[:3]]
+		kernel_version += [0] * (3 - len(kernel_version))
+		to_return["MajorVersion"], to_return["MinorVersion"], to_return["BuildNumber"] = kernel_version
+
+		to_return["NumberOfProcessors"] = min(os.cpu_count() or 1, 0xff)
+		to_return["PlatformId"] = PlatformId.VER_PLATFORM_LINUX.value
+		to_return["CSDVersion"] = f"{uname.release} {uname.version} {uname.machine}"
+
+		return to_return
+
+	def _modules_by_path(self, mappings):
+		# every file that is mapped executable somewhere is treated as a module spanning all of its mappings
+		executable_paths = set(path for _, _, perms, _, inode, path in mappings if inode != 0 and "x" in perms)
+
+		modules = {}
+		for start, end, perms, offset, inode, path in mappings:
+			if path not in executable_paths:
+				continue
+
+			if path in modules:
+				modules[path][1] = max(modules[path][1], end)
+			else:
+				modules[path] = [start, end]
+
+		return modules
+
+	def get_modules(self):
+		list_of_modules = []
+		for path, (start, end) in self._modules_by_path(self._mappings()).items():
+			current_module = {}
+			current_module["BaseOfImage"] = start
+			current_module["SizeOfImage"] = end - start
+			current_module["ModuleName"] = path
+			list_of_modules.append(current_module)
+
+		return list_of_modules
+
+	def get_threads(self):
+		threads = {}
+		arch = machine_to_arch.get(platform.machine(), None)
+		for tid in sorted(int(tid) for tid in os.listdir(f"/proc/{self.pid}/task")):
+			thread_info = {}
+			try:
+				with open(f"/proc/{self.pid}/task/{tid}/stat", "r") as stat_file:
+					# the comm field may contain spaces, the fixed fields start after its closing parenthesis
+					stat_fields = stat_file.read().rsplit(")", 1)[1].split()
+
+				thread_info["Priority"] = int(stat_fields[15])
+			except (OSError, IndexError):
+				# the thread exited while enumerating
+				continue
+
+			context = self._thread_context(tid, arch)
+			if context:
+				thread_info["Context"] = context
+
+			threads[tid] = thread_info
+
+		return threads
+
+	def _thread_context(self, tid, arch):
+		"""
+		stack and instruction pointer of a thread that is blocked, from /proc/<pid>/task/<tid>/syscall.
+		running threads and kernels without the file have no context
+		"""
+		try:
+			with open(f"/proc/{self.pid}/task/{tid}/syscall", "r") as syscall_file:
+				syscall_fields = syscall_file.read().split()
+		except OSError:
+			return None
+
+		if len(syscall_fields) < 3:
+			return None
+
+		stack_pointer = int(syscall_fields[-2], 16)
+		instruction_pointer = int(syscall_fields[-1], 16)
+		if arch == "amd64":
+			return {"Rsp": stack_pointer, "Rip": instruction_pointer}
+
+		if arch == "intel":
+			return {"Esp": stack_pointer, "Eip": instruction_pointer}
+
+		if arch == "arm64":
+			return {"Sp": stack_pointer, "Pc": instruction_pointer}
+
+		return None
+
+	def get_memory_info(self):
+		memory_info = []
+		mappings = self._mappings()
+		modules = self._modules_by_path(mappings)
+
+		for start, end, perms, offset, inode, path in mappings:
+			info = {}
+			info["BaseAddress"] = start
+			info["RegionSize"] = end - start
+			info["Protect"] = perms[:3]
+			info["AllocationProtect"] = perms[:3]
+
+			if path in modules:
+				info["Type"] = "Image"
+				info["AllocationBase"] = modules[path][0]
+			elif inode != 0:
+				info["Type"] = "Mapped"
+			else:
+				info["Type"] = "Private"
+
+			memory_info.append(info)
+
+		return memory_info
+
+	def get_memory_descriptors(self):
+		memory_descriptors_arr = []
+		for start, end, perms, offset, inode, path in self._mappings():
+			if perms[0] != "r" or path in UNREADABLE_MAPPINGS:
+				continue
+
+			memory_descriptors_arr.append((start, end - start, None))
+
+		return memory_descriptors_arr
+
+	def _process_vm_readv(self, address, buffer_address, size):
+		"""
+		reads up to IOV_MAX pages with one syscall. every page is its own remote iovec so the
+		read stops exactly at the first unreadable page, returns the amount of bytes read
+		"""
+		remote_iovecs = (iovec * IOV_MAX)()
+		remote_count = 0
+		remote_address = address
+		end_address = address + size
+		while remote_address < end_address and remote_count < IOV_MAX:
+			page_end = min(end_address, (remote_address // PAGE_SIZE + 1) * PAGE_SIZE)
+			remote_iovecs[remote_count].iov_base = remote_address
+			remote_iovecs[remote_count].iov_len = page_end - remote_address
+			remote_count += 1
+			remote_address = page_end
+
+		local_iovec = iovec(buffer_address, remote_address - address)
+		amount_read = _process_vm_readv(self.pid, ctypes.byref(local_iovec), 1, remote_iovecs, remote_count, 0)
+		if amount_read >= 0:
+			return amount_read
+
+		error = ctypes.get_errno()
+		if error == errno.EFAULT:
+			return 0
+
+		if error in (errno.EPERM, errno.ENOSYS):
+			# not allowed (or not built into the kernel), the rest of the dump uses /proc/<pid>/mem
+			self._use_process_vm_readv = False
+			return 0
+
+		raise OSError(error, os.strerror(error))
+
+	def _pread_mem(self, address, buffer):
+		if self._mem_fd is None:
+			self._mem_fd = os.open(f"/proc/{self.pid}/mem", os.O_RDONLY)
+
+		try:
+			return os.preadv(self._mem_fd, [buffer], address)
+		except OSError as e:
+			if e.errno in (errno.EIO, errno.EFAULT):
+				return 0
+			raise
+
+	def _read_pages(self, address, buffer, buffer_address):
+		"""
+		reads as much of the range as possible into buffer, yields the (start, end) offsets of the pages that
+		can't be read
+		"""
+		size = len(buffer)
+		offset = 0
+		while offset < size:
+			if self._use_process_vm_readv:
+				offset += self._process_vm_readv(address + offset, buffer_address + offset, size - offset)
+				if offset == size:
+					break
+
+			# the page at offset can't be read with process_vm_readv, retry it alone through /proc/<pid>/mem
+			page_end = min(size, ((address + offset) // PAGE_SIZE + 1) * PAGE_SIZE - address)
+			if not self._use_process_vm_readv:
+				page_end = size
+
+			amount_read = self._pread_mem(address + offset, buffer[offset:page_end])
+			offset += amount_read
+			if amount_read == 0:
+				# unreadable, skip to the next page
+				page_end = min(size, ((address + offset) // PAGE_SIZE + 1) * PAGE_SIZE - address)
+				yield offset, page_end
+				offset = page_end
+
+	def get_bytes_into(self, address, buffer, info):
+		buffer_address = ctypes.addressof((ctypes.c_char * len(buffer)).from_buffer(buffer))
+		for unreadable_start, unreadable_end in self._read_pages(address, buffer, buffer_address):
+			# left zero filled
+			ctypes.memset(buffer_address + unreadable_start, 0, unreadable_end - unreadable_start)
+
+		return len(buffer)
+
+	def probe_readable(self, address, size, info):
+		# get_bytes_into zero fills instead of failing, the pages are probed here through a scratch buffer
+		scratch = bytearray(min(size, PROBE_SCRATCH_SIZE))
+		scratch_address = ctypes.addressof((ctypes.c_char * len(scratch)).from_buffer(scratch))
+		# (start, end) offsets
+		readable_parts = []
+		offset = 0
+		while offset < size:
+			probe_size = min(size - offset, len(scratch))
+			readable_start = offset
+			unreadable_parts = list(self._read_pages(address + offset, memoryview(scratch)[:probe_size], scratch_address))
+			for unreadable_start, unreadable_end in unreadable_parts + [(probe_size, probe_size)]:
+				if offset + unreadable_start > readable_start:
+					if readable_parts and readable_parts[-1][1] == readable_start:
+						readable_parts[-1] = (readable_parts[-1][0], offset + unreadable_start)
+					else:
+						readable_parts.append((readable_start, offset + unreadable_start))
+
+				readable_start = offset + unreadable_end
+
+			offset += probe_size
+
+		return [(address + readable_start, readable_end - readable_start) for readable_start, readable_end in readable_parts]
+
+	def get_bytes(self, address, size, info):
+		buffer = bytearray(size)
+		self.get_bytes_into(address, memoryview(buffer), info)
+
+		return buffer
+
+def main():
+	pid = int(sys.argv[1])
+	output_path = f"linux_writer_{pid}.dmp"
+	if len(sys.argv) > 2:
+		output_path = sys.argv[2]
+
+	# "-" streams the dump to stdout so it can be piped without a temporary file
+	if output_path == "-":
+		test_writer = linux_writer(sys.stdout.buffer, pid=pid)
+		test_writer.write()
+		return
+
+	with open(output_path, "wb") as f:
+		test_writer = linux_writer(f, pid=pid)
+		test_writer.write()
+
+if __name__ == "__main__":
+	main()
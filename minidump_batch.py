@@ -0,0 +1,146 @@
+"""
+batch dumps of many processes
+
+batch_dumper runs the writers of a batch in a process pool, every writer fetches and compresses on its own
+core. a shared_io_scheduler is handed to all of them: it bounds the bytes read from the providers and not yet
+written, summed over every writer, and paces the payload writes to the bandwidth of the disk so the writers
+share it instead of fighting over it
+
+providers hold handles of the dumped process that can't be pickled into a worker, a dump_job carries the
+writer class and its arguments and the writer is created in the worker
+"""
+from concurrent.futures import ProcessPoolExecutor
+import logging
+import multiprocessing
+import os
+import sys
+import time
+
+class shared_io_scheduler:
+	"""
+	max_in_flight bounds the bytes of every writer read but not yet written, a chunk larger than that is let
+	through alone. disk_bandwidth (bytes per second, None for no limit) is split between the writers in the
+	order they ask for it. the state lives in shared memory so the scheduler works across the pool's workers
+	"""
+	def __init__(self, max_in_flight=0x10000000, disk_bandwidth=None, context=None):
+		context = context or multiprocessing.get_context()
+		self.max_in_flight = max_in_flight
+		self.disk_bandwidth = disk_bandwidth
+
+		self._condition = context.Condition()
+		self._in_flight = context.Value("Q", 0, lock=False)
+
+		# time.monotonic() at which the disk is free again, system wide so every worker agrees on it
+		self._bandwidth_lock = context.Lock()
+		self._disk_free_time = context.Value("d", 0.0, lock=False)
+
+	def acquire(self, amount, blocking=True):
+		with self._condition:
+			while self._in_flight.value and self._in_flight.value + amount > self.max_in_flight:
+				if not blocking:
+					return False
+
+				self._condition.wait()
+
+			self._in_flight.value += amount
+
+		return True
+
+	def release(self, amount):
+		with self._condition:
+			self._in_flight.value -= amount
+			self._condition.notify_all()
+
+	def reserve_write(self, size):
+		"""
+		blocks until size bytes may be written without the writers exceeding disk_bandwidth together
+		"""
+		if self.disk_bandwidth is None:
+			return
+
+		with self._bandwidth_lock:
+			now = time.monotonic()
+			write_time = max(now, self._disk_free_time.value)
+			self._disk_free_time.value = write_time + size / self.disk_bandwidth
+
+		if write_time > now:
+			time.sleep(write_time - now)
+
+class dump_job:
+	"""
+	writer_class(output file, *args, **kwargs).write() to output_path, run in a worker
+	"""
+	def __init__(self, writer_class, output_path, *args, **kwargs):
+		self.writer_class = writer_class
+		self.output_path = output_path
+		self.args = args
+		self.kwargs = kwargs
+
+# set in every worker of the pool
+_worker_io_scheduler = None
+
+def _initialize_worker(io_scheduler):
+	global _worker_io_scheduler
+	_worker_io_scheduler = io_scheduler
+
+def _run_job(job):
+	write_start = time.perf_counter()
+	with open(job.output_path, "wb") as output_file:
+		writer = job.writer_class(output_file, *job.args, io_scheduler=_worker_io_scheduler, **job.kwargs)
+		writer.write()
+
+	return {"output_path": job.output_path, "seconds": time.perf_counter() - write_start, "size": os.path.getsize(job.output_path)}
+
+class batch_dumper:
+	"""
+	processes is the size of the pool (all cores by default), max_in_flight and disk_bandwidth configure the
+	shared_io_scheduler of the batch
+	"""
+	def __init__(self, processes=None, max_in_flight=0x10000000, disk_bandwidth=None):
+		self.processes = processes or os.cpu_count() or 1
+		self.max_in_flight = max_in_flight
+		self.disk_bandwidth = disk_bandwidth
+
+	def run(self, jobs):
+		"""
+		writes every job, a failing dump doesn't stop the others. returns a dict per job in the order of jobs,
+		{"output_path", "seconds", "size"} or {"output_path", "error"}
+		"""
+		context = multiprocessing.get_context()
+		io_scheduler = shared_io_scheduler(self.max_in_flight, self.disk_bandwidth, context)
+
+		results = []
+		with ProcessPoolExecutor(self.processes, mp_context=context, initializer=_initialize_worker, initargs=(io_scheduler,)) as executor:
+			futures = [executor.submit(_run_job, job) for job in jobs]
+			for job, future in zip(jobs, futures):
+				try:
+					results.append(future.result())
+				except Exception as e:
+					logging.warning(f"Dumping to {job.output_path} failed: {e}")
+					results.append({"output_path": job.output_path, "error": e})
+
+		return results
+
+def pid_jobs(pids, output_directory=".", *args, **kwargs):
+	"""
+	a job per pid with the writer of the platform, the dumps are named like the writer's main() names them
+	"""
+	if os.name == "nt":
+		from windows_writer import windows_writer as writer_class
+	else:
+		from linux_writer import linux_writer as writer_class
+
+	return [dump_job(writer_class, os.path.join(output_directory, f"{writer_class.__name__}_{pid}.dmp"), pid, *args, **kwargs) for pid in pids]
+
+def main():
+	output_directory = sys.argv[1]
+	pids = [int(pid) for pid in sys.argv[2:]]
+
+	for result in batch_dumper().run(pid_jobs(pids, output_directory)):
+		if "error" in result:
+			print(f"{result['output_path']}: {result['error']}")
+		else:
+			print(f"{result['output_path']}: {result['size']:#x} bytes in {result['seconds']:.1f}s")
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,211 @@
+"""
+columnar region tables
+
+get_memory_info and get_memory_descriptors may return a table instead of a list, either
+a NumPy structured array or a dict of columns (array.array, NumPy arrays or plain sequences).
+columns use the get_memory_info names:
+
+BaseAddress
+AllocationBase - Optional, 0 entries are replaced by BaseAddress
+AllocationProtect - Optional, string ("r-x") or MemoryProtection value, defaults to "rwx"
+Protect - Optional, string or MemoryProtection value, defaults to "rwx"
+RegionSize
+State - Optional, defaults to MEM_COMMIT
+Type - Optional, string ("Private") or MemoryType value, defaults to "Private"
+Info - Optional, descriptors only, passed as info to get_bytes (None if missing)
+
+the whole table is converted to the on-disk layout at once, with NumPy when it is installed
+and with strided memoryview assignment otherwise.
+the same table can be returned from both get_memory_info and get_memory_descriptors
+"""
+from array import array
+
+from minidump_structs import *
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+MEM_COMMIT = 0x1000
+
+# offsets of the MINIDUMP_MEMORY_INFO fields in 8 and 4 byte units
+_MEMORY_INFO_QWORDS = MINIDUMP_MEMORY_INFO.size() // 8
+_MEMORY_INFO_DWORDS = MINIDUMP_MEMORY_INFO.size() // 4
+
+def is_columnar(table):
+	if isinstance(table, dict):
+		return True
+
+	dtype = getattr(table, "dtype", None)
+	return dtype is not None and dtype.names is not None
+
+def _column(table, name):
+	if isinstance(table, dict):
+		return table.get(name, None)
+
+	if name in table.dtype.names:
+		return table[name]
+
+	return None
+
+def table_length(table):
+	if isinstance(table, dict):
+		for column in table.values():
+			return len(column)
+
+		return 0
+
+	return len(table)
+
+def _lookup_value(value, lookup):
+	if isinstance(value, bytes):
+		value = value.decode()
+
+	if isinstance(value, str):
+		return lookup[value]
+
+	return int(value)
+
+def _numpy_column(column, length, default, lookup=None):
+	if column is None:
+		return numpy.full(length, _lookup_value(default, lookup) if lookup else default, dtype=numpy.uint64)
+
+	column = numpy.asarray(column)
+	if lookup is None:
+		return column.astype(numpy.uint64, copy=False)
+
+	if column.dtype.kind in "US":
+		# translate every distinct string once instead of once per region
+		uniques, inverse = numpy.unique(column, return_inverse=True)
+		translated = numpy.array([_lookup_value(unique, lookup) for unique in uniques.tolist()], dtype=numpy.uint64)
+		return translated[inverse]
+
+	if column.dtype.kind == "O":
+		return numpy.fromiter((_lookup_value(value, lookup) for value in column), dtype=numpy.uint64, count=length)
+
+	return column.astype(numpy.uint64, copy=False)
+
+def _array_column(column, length, default, typecode, lookup=None):
+	if column is None:
+		if lookup:
+			default = _lookup_value(default, lookup)
+		return array(typecode, [default]) * length
+
+	if lookup is not None:
+		cache = {}
+		translated = array(typecode)
+		for value in column:
+			translated_value = cache.get(value, None)
+			if translated_value is None:
+				translated_value = cache[value] = _lookup_value(value, lookup)
+			translated.append(translated_value)
+
+		return translated
+
+	if isinstance(column, array) and column.typecode == typecode:
+		return column
+
+	return array(typecode, column)
+
+def memory_info_table(table):
+	"""
+	returns the MINIDUMP_MEMORY_INFO entries of the table as one buffer
+	"""
+	length = table_length(table)
+	if numpy is not None:
+		entries = numpy.zeros(length, dtype=numpy.dtype(MINIDUMP_MEMORY_INFO))
+		base_address = _numpy_column(_column(table, "BaseAddress"), length, 0)
+		allocation_base = _numpy_column(_column(table, "AllocationBase"), length, 0)
+
+		entries["BaseAddress"] = base_address
+		entries["AllocationBase"] = numpy.where(allocation_base == 0, base_address, allocation_base)
+		entries["AllocationProtect"] = _numpy_column(_column(table, "AllocationProtect"), length, "rwx", string_protect_to_MemoryProtection)
+		entries["Protect"] = _numpy_column(_column(table, "Protect"), length, "rwx", string_protect_to_MemoryProtection)
+		entries["RegionSize"] = _numpy_column(_column(table, "RegionSize"), length, 0)
+		entries["State"] = _numpy_column(_column(table, "State"), length, MEM_COMMIT)
+		entries["Type"] = _numpy_column(_column(table, "Type"), length, "Private", string_type_to_MemoryType)
+
+		return entries.tobytes()
+
+	entries = bytearray(length * MINIDUMP_MEMORY_INFO.size())
+	qwords = memoryview(entries).cast("Q")
+	dwords = memoryview(entries).cast("I")
+
+	base_address = _array_column(_column(table, "BaseAddress"), length, 0, "Q")
+	allocation_base = _array_column(_column(table, "AllocationBase"), length, 0, "Q")
+	if 0 in allocation_base:
+		allocation_base = array("Q", [allocation or base for allocation, base in zip(allocation_base, base_address)])
+
+	qwords[0::_MEMORY_INFO_QWORDS] = base_address
+	qwords[1::_MEMORY_INFO_QWORDS] = allocation_base
+	dwords[4::_MEMORY_INFO_DWORDS] = _array_column(_column(table, "AllocationProtect"), length, "rwx", "I", string_protect_to_MemoryProtection)
+	qwords[3::_MEMORY_INFO_QWORDS] = _array_column(_column(table, "RegionSize"), length, 0, "Q")
+	dwords[8::_MEMORY_INFO_DWORDS] = _array_column(_column(table, "State"), length, MEM_COMMIT, "I")
+	dwords[9::_MEMORY_INFO_DWORDS] = _array_column(_column(table, "Protect"), length, "rwx", "I", string_protect_to_MemoryProtection)
+	dwords[10::_MEMORY_INFO_DWORDS] = _array_column(_column(table, "Type"), length, "Private", "I", string_type_to_MemoryType)
+
+	return entries
+
+def memory_descriptor_table(table):
+	"""
+	returns (MINIDUMP_MEMORY_DESCRIPTOR64 entries as one buffer, total size of the ranges)
+	"""
+	length = table_length(table)
+	if numpy is not None:
+		entries = numpy.zeros(length, dtype=numpy.dtype(MINIDUMP_MEMORY_DESCRIPTOR64))
+		entries["StartOfMemoryRange"] = _numpy_column(_column(table, "BaseAddress"), length, 0)
+		entries["DataSize"] = _numpy_column(_column(table, "RegionSize"), length, 0)
+
+		return entries.tobytes(), int(entries["DataSize"].sum(dtype=numpy.uint64))
+
+	entries = bytearray(length * MINIDUMP_MEMORY_DESCRIPTOR64.size())
+	qwords = memoryview(entries).cast("Q")
+	region_size = _array_column(_column(table, "RegionSize"), length, 0, "Q")
+	qwords[0::2] = _array_column(_column(table, "BaseAddress"), length, 0, "Q")
+	qwords[1::2] = region_size
+
+	return entries, sum(region_size)
+
+def iter_memory_descriptors(table):
+	"""
+	yields (range_start, range_size, info) for both descriptor lists and tables
+	"""
+	if not is_columnar(table):
+		yield from table
+		return
+
+	length = table_length(table)
+	starts = _column(table, "BaseAddress")
+	sizes = _column(table, "RegionSize")
+	infos = _column(table, "Info")
+	if infos is None:
+		infos = [None] * length
+
+	for range_start, range_size, info in zip(starts, sizes, infos):
+		yield int(range_start), int(range_size), info
+
+def iter_memory_info(table):
+	"""
+	yields a get_memory_info dict per region for both region lists and tables, tables only have the
+	keys of the columns they provide
+	"""
+	if not is_columnar(table):
+		yield from table
+		return
+
+	columns = {}
+	for name in ("BaseAddress", "AllocationBase", "AllocationProtect", "Protect", "RegionSize", "State", "Type"):
+		column = _column(table, name)
+		if column is not None:
+			columns[name] = column
+
+	for row in zip(*columns.values()):
+		info = {}
+		for name, value in zip(columns, row):
+			if isinstance(value, bytes):
+				value = value.decode()
+
+			info[name] = value if isinstance(value, str) else int(value)
+
+		yield info
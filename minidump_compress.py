@@ -0,0 +1,220 @@
+"""
+block compressed dump container
+
+the dump is cut into fixed-size blocks that are compressed independently in a thread pool (zlib and lzma
+release the GIL), so compression keeps up with the fetchers on multiple cores. the index at the end maps
+every block to its compressed location, any offset of the dump can be read without decompressing the rest
+
+	header: COMPRESSED_MAGIC, version, method, block size
+	compressed blocks in file order
+	index: compressed offset of every block
+	trailer: index offset, block count, uncompressed size, COMPRESSED_MAGIC
+"""
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+import lzma
+import os
+import struct
+import sys
+import zlib
+
+COMPRESSED_MAGIC = b"MDMPBLKZ"
+COMPRESSED_VERSION = 1
+COMPRESSED_HEADER = struct.Struct("<8sIII")
+COMPRESSED_TRAILER = struct.Struct("<QQQ8s")
+
+COMPRESSION_ZLIB = 1
+COMPRESSION_LZMA = 2
+
+compression_methods = {
+	"zlib": COMPRESSION_ZLIB,
+	"lzma": COMPRESSION_LZMA,
+}
+
+def _compress_block(method, level, block):
+	if method == COMPRESSION_ZLIB:
+		return zlib.compress(block, level)
+
+	return lzma.compress(block, preset=level)
+
+def _decompress_block(method, block):
+	if method == COMPRESSION_ZLIB:
+		return zlib.decompress(block)
+
+	return lzma.decompress(block)
+
+class block_compressor:
+	"""
+	file-like sink that compresses everything written to it into output. output only needs write()
+	(or sendall), the container is emitted front to back. close() writes the index and must be called
+	"""
+	def __init__(self, output, method="zlib", level=None, block_size=0x100000, threads=None):
+		self._output_write = getattr(output, "write", None)
+		if self._output_write is None:
+			self._output_write = output.sendall
+
+		self._output = output
+		self.method = compression_methods[method]
+		self.level = level
+		if self.level is None:
+			self.level = 6 if self.method == COMPRESSION_ZLIB else 1
+
+		self.block_size = block_size
+		self.threads = threads or os.cpu_count() or 1
+
+		self._executor = ThreadPoolExecutor(self.threads)
+		# compressions in flight, written in submission order
+		self._pending = deque()
+		self._block = bytearray()
+		self._block_offsets = array("Q")
+		self._compressed_offset = 0
+		self.uncompressed_size = 0
+
+		self._emit(COMPRESSED_HEADER.pack(COMPRESSED_MAGIC, COMPRESSED_VERSION, self.method, self.block_size))
+
+	def _emit(self, buffer):
+		view = memoryview(buffer).cast("B")
+		while len(view) > 0:
+			written = self._output_write(view)
+			if written is None:
+				written = len(view)
+
+			view = view[written:]
+			self._compressed_offset += written
+
+	def write(self, buffer):
+		view = memoryview(buffer).cast("B")
+		self._block += view
+		self.uncompressed_size += len(view)
+
+		while len(self._block) >= self.block_size:
+			self._submit(bytes(self._block[:self.block_size]))
+			del self._block[:self.block_size]
+
+		return len(view)
+
+	def _submit(self, block):
+		self._pending.append(self._executor.submit(_compress_block, self.method, self.level, block))
+
+		# two blocks per thread keep every thread busy while the oldest is written
+		while len(self._pending) > 2 * self.threads or (self._pending and self._pending[0].done()):
+			self._write_block(self._pending.popleft().result())
+
+	def _write_block(self, compressed_block):
+		self._block_offsets.append(self._compressed_offset)
+		self._emit(compressed_block)
+
+	def flush(self):
+		flush = getattr(self._output, "flush", None)
+		if flush is not None:
+			flush()
+
+	def abort(self):
+		"""
+		stops the compression without writing the index, after a failed write. does nothing after close()
+		"""
+		self._pending.clear()
+		self._executor.shutdown(cancel_futures=True)
+
+	def close(self):
+		try:
+			if self._block:
+				self._submit(bytes(self._block))
+				self._block = bytearray()
+
+			while self._pending:
+				self._write_block(self._pending.popleft().result())
+		finally:
+			self._executor.shutdown()
+
+		index_offset = self._compressed_offset
+		self._emit(self._block_offsets.tobytes())
+		self._emit(COMPRESSED_TRAILER.pack(index_offset, len(self._block_offsets), self.uncompressed_size, COMPRESSED_MAGIC))
+		self.flush()
+
+class block_compressed_reader:
+	"""
+	random access to a block compressed dump, the last cache_blocks decompressed blocks are kept
+	"""
+	def __init__(self, path, cache_blocks=4):
+		self._compressed_file = open(path, "rb")
+		self._cache = OrderedDict()
+		self.cache_blocks = cache_blocks
+
+		magic, version, self.method, self.block_size = COMPRESSED_HEADER.unpack(self._compressed_file.read(COMPRESSED_HEADER.size))
+		if magic != COMPRESSED_MAGIC or version != COMPRESSED_VERSION:
+			raise ValueError("Not a block compressed minidump")
+
+		self._compressed_file.seek(-COMPRESSED_TRAILER.size, os.SEEK_END)
+		trailer_offset = self._compressed_file.tell()
+		index_offset, block_count, self.uncompressed_size, magic = COMPRESSED_TRAILER.unpack(self._compressed_file.read(COMPRESSED_TRAILER.size))
+		if magic != COMPRESSED_MAGIC:
+			raise ValueError("Block compressed minidump has no index, it was not closed")
+
+		self._compressed_file.seek(index_offset)
+		self._block_offsets = array("Q")
+		self._block_offsets.frombytes(self._compressed_file.read(block_count * self._block_offsets.itemsize))
+		# the end of the last block
+		self._block_offsets.append(index_offset)
+		if len(self._block_offsets) != block_count + 1 or index_offset + block_count * 8 != trailer_offset:
+			raise ValueError("Block compressed minidump index is corrupted")
+
+	def close(self):
+		self._compressed_file.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.close()
+
+	def block_for_offset(self, offset):
+		"""
+		index of the block holding the uncompressed offset
+		"""
+		if not 0 <= offset < self.uncompressed_size:
+			raise ValueError(f"{offset:#x} is out of the dump")
+
+		return offset // self.block_size
+
+	def read_block(self, block_index):
+		block = self._cache.get(block_index, None)
+		if block is not None:
+			self._cache.move_to_end(block_index)
+			return block
+
+		compressed_start = self._block_offsets[block_index]
+		self._compressed_file.seek(compressed_start)
+		block = _decompress_block(self.method, self._compressed_file.read(self._block_offsets[block_index + 1] - compressed_start))
+
+		self._cache[block_index] = block
+		if len(self._cache) > self.cache_blocks:
+			self._cache.popitem(last=False)
+
+		return block
+
+	def read_at(self, offset, size):
+		"""
+		size bytes of the dump at offset, fewer at the end of the dump
+		"""
+		to_return = bytearray()
+		size = min(size, self.uncompressed_size - offset)
+		while len(to_return) < size:
+			block_index = self.block_for_offset(offset + len(to_return))
+			block_offset = offset + len(to_return) - block_index * self.block_size
+			to_return += self.read_block(block_index)[block_offset:block_offset + size - len(to_return)]
+
+		return bytes(to_return)
+
+	def decompress_to(self, output_file):
+		for block_index in range(len(self._block_offsets) - 1):
+			output_file.write(self.read_block(block_index))
+
+def main():
+	compressed_path, output_path = sys.argv[1:3]
+	with block_compressed_reader(compressed_path) as reader, open(output_path, "wb") as output_file:
+		reader.decompress_to(output_file)
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,273 @@
+"""
+incremental dumps against a baseline minidump
+
+a delta holds the dump as a sequence of records: literal bytes (metadata and changed memory) and
+references to byte runs of the baseline. memory is compared with the baseline page by page at the same
+virtual address, unchanged runs become a single reference record.
+
+	delta header: DELTA_MAGIC, baseline file size, baseline TimeDateStamp
+	record: kind, length, baseline offset (followed by length bytes for DELTA_LITERAL)
+	DELTA_END record: length is the size of the materialized dump
+"""
+import struct
+import sys
+
+from minidump_enums import *
+from minidump_structs import *
+
+DELTA_MAGIC = b"MDMPDELT"
+DELTA_HEADER = struct.Struct("<8sQI")
+DELTA_RECORD = struct.Struct("<IQQ")
+
+DELTA_END = 0
+DELTA_LITERAL = 1
+DELTA_BASELINE = 2
+
+DELTA_PAGE_SIZE = 0x1000
+# pending literal bytes are written out once they reach this size
+MAX_PENDING_LITERAL = 0x100000
+
+def _open_baseline(baseline):
+	# imported here, minidump_reader depends on minidump_writer which depends on this module
+	from minidump_reader import minidump_reader
+
+	if isinstance(baseline, minidump_reader):
+		return baseline
+
+	return minidump_reader(baseline)
+
+class minidump_delta_encoder:
+	"""
+	file-like sink that turns the byte stream of a standard dump into a delta against baseline.
+	minidump_writer(file, baseline=...) writes through it
+	"""
+	def __init__(self, baseline, output):
+		self._baseline = _open_baseline(baseline)
+		self._owns_baseline = self._baseline is not baseline
+		self._output = output
+
+		self._offset = 0
+		self._prefix = bytearray()
+		self._payload_start = None
+		# (start of memory, size) of every Memory64 range in file order
+		self._ranges = []
+		self._range_index = 0
+		self._range_offset = 0
+		self._baseline_range = (0, 0, 0)
+
+		self._pending_kind = None
+		self._pending_length = 0
+		self._pending_baseline_offset = 0
+		self._pending_data = []
+
+		self.literal_bytes = 0
+		self.baseline_bytes = 0
+
+		self._output.write(DELTA_HEADER.pack(DELTA_MAGIC, len(self._baseline._map), self._baseline.dump_header.TimeDateStamp))
+
+	def write(self, buffer):
+		view = memoryview(buffer).cast("B")
+		amount = len(view)
+
+		if self._payload_start is None:
+			self._prefix += view
+			self._offset += amount
+			self._parse_prefix()
+			if self._payload_start is None:
+				return amount
+
+			# everything before the payload is stored as is, the rest is compared with the baseline
+			prefix = memoryview(self._prefix)
+			self._literal(prefix[:self._payload_start])
+			self._memory(prefix[self._payload_start:])
+			self._prefix = None
+			return amount
+
+		self._memory(view)
+		self._offset += amount
+		return amount
+
+	def _parse_prefix(self):
+		"""
+		finds the Memory64 payload once the header, directory and Memory64 list were received
+		"""
+		prefix = self._prefix
+		if len(prefix) < MINIDUMP_HEADER.size():
+			return
+
+		header = MINIDUMP_HEADER.from_buffer_copy(prefix)
+		directory_end = header.StreamDirectoryRva + header.NumberOfStreams * MINIDUMP_DIRECTORY.size()
+		if len(prefix) < directory_end:
+			return
+
+		for stream_index in range(header.NumberOfStreams):
+			directory = MINIDUMP_DIRECTORY.from_buffer_copy(prefix, header.StreamDirectoryRva + stream_index * MINIDUMP_DIRECTORY.size())
+			if directory.StreamType != MINIDUMP_STREAM_TYPE.Memory64ListStream.value:
+				continue
+
+			if len(prefix) < directory.Location.Rva + directory.Location.DataSize:
+				return
+
+			memory64_list_struct = MINIDUMP_MEMORY64_LIST.from_buffer_copy(prefix, directory.Location.Rva)
+			for range_index in range(memory64_list_struct.NumberOfMemoryRanges):
+				descriptor_struct = MINIDUMP_MEMORY_DESCRIPTOR64.from_buffer_copy(prefix, directory.Location.Rva + MINIDUMP_MEMORY64_LIST.size() + range_index * MINIDUMP_MEMORY_DESCRIPTOR64.size())
+				self._ranges.append((descriptor_struct.StartOfMemoryRange, descriptor_struct.DataSize))
+
+			self._payload_start = memory64_list_struct.BaseRva
+			return
+
+	def _memory(self, view):
+		while len(view) > 0:
+			while self._range_index < len(self._ranges) and self._range_offset == self._ranges[self._range_index][1]:
+				self._range_index += 1
+				self._range_offset = 0
+
+			if self._range_index == len(self._ranges):
+				# past the last range, nothing to compare with
+				self._literal(view)
+				return
+
+			range_start, range_size = self._ranges[self._range_index]
+			address = range_start + self._range_offset
+			# pieces end on page boundaries so unchanged pages next to changed ones are still found
+			piece_size = min(len(view), range_size - self._range_offset, DELTA_PAGE_SIZE - address % DELTA_PAGE_SIZE)
+			piece = view[:piece_size]
+
+			baseline_offset = self._baseline_offset(address, piece_size)
+			if baseline_offset is not None and self._baseline._map[baseline_offset:baseline_offset + piece_size] == piece.tobytes():
+				self._reference(piece_size, baseline_offset)
+			else:
+				self._literal(piece)
+
+			view = view[piece_size:]
+			self._range_offset += piece_size
+
+	def _baseline_offset(self, address, size):
+		baseline_start, baseline_size, baseline_file_offset = self._baseline_range
+		if not (baseline_start <= address and address + size <= baseline_start + baseline_size):
+			found = self._baseline.find(address)
+			if found is None:
+				return None
+
+			self._baseline_range = found
+			baseline_start, baseline_size, baseline_file_offset = found
+			if address + size > baseline_start + baseline_size:
+				return None
+
+		return baseline_file_offset + (address - baseline_start)
+
+	def _literal(self, view):
+		if len(view) == 0:
+			return
+
+		if self._pending_kind != DELTA_LITERAL or self._pending_length >= MAX_PENDING_LITERAL:
+			self._flush_pending()
+			self._pending_kind = DELTA_LITERAL
+
+		self._pending_data.append(bytes(view))
+		self._pending_length += len(view)
+		self.literal_bytes += len(view)
+
+	def _reference(self, length, baseline_offset):
+		if self._pending_kind != DELTA_BASELINE or self._pending_baseline_offset + self._pending_length != baseline_offset:
+			self._flush_pending()
+			self._pending_kind = DELTA_BASELINE
+			self._pending_baseline_offset = baseline_offset
+
+		self._pending_length += length
+		self.baseline_bytes += length
+
+	def _flush_pending(self):
+		if self._pending_kind is not None:
+			self._output.write(DELTA_RECORD.pack(self._pending_kind, self._pending_length, self._pending_baseline_offset if self._pending_kind == DELTA_BASELINE else 0))
+			for data in self._pending_data:
+				self._output.write(data)
+
+		self._pending_kind = None
+		self._pending_length = 0
+		self._pending_baseline_offset = 0
+		self._pending_data = []
+
+	def close(self):
+		if self._prefix:
+			# no Memory64 stream, the whole dump is metadata
+			self._literal(memoryview(self._prefix))
+			self._prefix = None
+
+		self._flush_pending()
+		self._output.write(DELTA_RECORD.pack(DELTA_END, self._offset, 0))
+
+		flush = getattr(self._output, "flush", None)
+		if flush is not None:
+			flush()
+
+		self._close_baseline()
+
+	def abort(self):
+		"""
+		releases the baseline without finishing the delta, after a failed write. does nothing after close()
+		"""
+		self._close_baseline()
+
+	def _close_baseline(self):
+		if self._owns_baseline:
+			self._baseline.close()
+			self._owns_baseline = False
+
+def materialize(baseline, delta_file, output_file):
+	"""
+	rebuilds the standard dump described by delta_file (a readable file object) into output_file
+	"""
+	baseline_reader = _open_baseline(baseline)
+	try:
+		return _materialize(baseline_reader, delta_file, output_file)
+	finally:
+		if baseline_reader is not baseline:
+			baseline_reader.close()
+
+def _materialize(baseline, delta_file, output_file):
+	magic, baseline_size, baseline_timestamp = DELTA_HEADER.unpack(delta_file.read(DELTA_HEADER.size))
+	if magic != DELTA_MAGIC:
+		raise ValueError("Not a minidump delta")
+
+	if baseline_size != len(baseline._map) or baseline_timestamp != baseline.dump_header.TimeDateStamp:
+		raise ValueError("The delta was made against a different baseline")
+
+	output_size = 0
+	while True:
+		record = delta_file.read(DELTA_RECORD.size)
+		if len(record) != DELTA_RECORD.size:
+			raise ValueError("Truncated delta")
+
+		kind, length, baseline_offset = DELTA_RECORD.unpack(record)
+		if kind == DELTA_END:
+			if length != output_size:
+				raise ValueError(f"Delta describes {length:#x} bytes, materialized {output_size:#x}")
+
+			return output_size
+
+		if kind == DELTA_BASELINE:
+			for piece_offset in range(0, length, MAX_PENDING_LITERAL):
+				piece_start = baseline_offset + piece_offset
+				output_file.write(baseline._view[piece_start:piece_start + min(MAX_PENDING_LITERAL, length - piece_offset)])
+		elif kind == DELTA_LITERAL:
+			remaining = length
+			while remaining > 0:
+				data = delta_file.read(min(MAX_PENDING_LITERAL, remaining))
+				if not data:
+					raise ValueError("Truncated delta")
+
+				output_file.write(data)
+				remaining -= len(data)
+		else:
+			raise ValueError(f"Unknown delta record {kind}")
+
+		output_size += length
+
+def main():
+	baseline_path, delta_path, output_path = sys.argv[1:4]
+	with open(delta_path, "rb") as delta_file, open(output_path, "wb") as output_file:
+		materialize(baseline_path, delta_file, output_file)
+
+if __name__ == "__main__":
+	main()
@@ -68,6 +68,7 @@ class MINIDUMP_TYPE(enum.IntFlag):
 class ProcessorArchitecture(enum.IntFlag):
 	PROCESSOR_ARCHITECTURE_AMD64 = 9
 	PROCESSOR_ARCHITECTURE_ARM = 5
+	PROCESSOR_ARCHITECTURE_ARM64 = 12
 	PROCESSOR_ARCHITECTURE_IA64 = 6
 	PROCESSOR_ARCHITECTURE_INTEL = 0
 	PROCESSOR_ARCHITECTURE_UNKNOWN = 0xffff
@@ -75,6 +76,7 @@ class ProcessorArchitecture(enum.IntFlag):
 arch_to_ProcessorArchitecture = {
 	"amd64": ProcessorArchitecture.PROCESSOR_ARCHITECTURE_AMD64.value,
 	"arm": ProcessorArchitecture.PROCESSOR_ARCHITECTURE_ARM.value,
+	"arm64": ProcessorArchitecture.PROCESSOR_ARCHITECTURE_ARM64.value,
 	"ia64": ProcessorArchitecture.PROCESSOR_ARCHITECTURE_IA64.value,
 	"intel": ProcessorArchitecture.PROCESSOR_ARCHITECTURE_INTEL.value,
 }
@@ -94,3 +96,4 @@ class PlatformId(enum.IntFlag):
 	VER_PLATFORM_WIN32s = 0
 	VER_PLATFORM_WIN32_WINDOWS = 1
 	VER_PLATFORM_WIN32_NT = 2
+	VER_PLATFORM_LINUX = 0x8201 # breakpad MD_OS_LINUX
@@ -0,0 +1,121 @@
+"""
+instrumentation for minidump_writer
+
+pass an instance as minidump_writer(file, instrumentation=...). the writer only looks at it when it is
+set, a writer without one pays a single attribute check per chunk.
+
+records per stream enumeration (getter), serialization (translator) and post translator times, latency
+histograms and byte counts of provider reads and disk writes, and calls progress(bytes_done, bytes_total)
+while the memory payload is written
+"""
+import threading
+import time
+
+from minidump_enums import *
+
+class latency_histogram:
+	"""
+	power of two buckets of microseconds, bucket i counts latencies below 2**i us
+	"""
+	BUCKETS = 32
+
+	def __init__(self):
+		self.counts = [0] * self.BUCKETS
+		self.count = 0
+		self.total_bytes = 0
+		self.total_time = 0.0
+		self.max_time = 0.0
+
+	def record(self, seconds, size):
+		self.counts[min(int(seconds * 1e6).bit_length(), self.BUCKETS - 1)] += 1
+		self.count += 1
+		self.total_bytes += size
+		self.total_time += seconds
+		self.max_time = max(self.max_time, seconds)
+
+	def percentile(self, fraction):
+		"""
+		upper bound in seconds of the bucket holding the fraction (0.5, 0.99) of the samples
+		"""
+		wanted = fraction * self.count
+		seen = 0
+		for bucket, bucket_count in enumerate(self.counts):
+			seen += bucket_count
+			if bucket_count and seen >= wanted:
+				return (1 << bucket) / 1e6
+
+		return 0.0
+
+	def summary(self):
+		return {
+			"count": self.count,
+			"bytes": self.total_bytes,
+			"seconds": self.total_time,
+			"max_seconds": self.max_time,
+			"p50_seconds": self.percentile(0.5),
+			"p99_seconds": self.percentile(0.99),
+			"buckets_us": {1 << bucket: bucket_count for bucket, bucket_count in enumerate(self.counts) if bucket_count},
+		}
+
+class write_instrumentation:
+	def __init__(self, progress=None, progress_interval=0.1):
+		self.progress = progress
+		# seconds between two progress calls, the last one is always made
+		self.progress_interval = progress_interval
+
+		# stream name -> phase ("enumerate", "serialize", "post") -> seconds
+		self.stream_times = {}
+		self.reads = latency_histogram()
+		self.writes = latency_histogram()
+		self.total_bytes = 0
+		self.done_bytes = 0
+
+		# the parallel fetcher records from its worker threads
+		self._lock = threading.Lock()
+		self._last_progress = 0.0
+
+	def record_stream(self, stream_type, phase, seconds):
+		try:
+			stream_name = MINIDUMP_STREAM_TYPE(stream_type).name
+		except ValueError:
+			stream_name = str(stream_type)
+
+		phases = self.stream_times.setdefault(stream_name, {})
+		phases[phase] = phases.get(phase, 0.0) + seconds
+
+	def begin_payload(self, total_bytes):
+		self.total_bytes = total_bytes
+		self.done_bytes = 0
+		self._last_progress = time.perf_counter()
+		if self.progress is not None:
+			self.progress(0, total_bytes)
+
+	def record_read(self, seconds, size):
+		with self._lock:
+			self.reads.record(seconds, size)
+
+	def record_write(self, seconds, size, payload=True):
+		with self._lock:
+			self.writes.record(seconds, size)
+			if not payload:
+				return
+
+			self.done_bytes += size
+			done_bytes = self.done_bytes
+
+			now = time.perf_counter()
+			if self.progress is None or (now - self._last_progress < self.progress_interval and done_bytes != self.total_bytes):
+				return
+
+			self._last_progress = now
+
+		self.progress(done_bytes, self.total_bytes)
+
+	def report(self):
+		return {
+			"streams": self.stream_times,
+			"reads": self.reads.summary(),
+			"writes": self.writes.summary(),
+			"payload_bytes": self.total_bytes,
+			"payload_bytes_done": self.done_bytes,
+		}
@@ -0,0 +1,187 @@
+"""
+completion journal of a dump being written
+
+the journal records which parts of the memory payload reached the dump file, so a write that failed part way
+(provider error, full disk, target paused for too long) can be resumed with minidump_writer(file, journal=path,
+resume=True). the header, directory and memory list the dump starts with are checked against a fresh layout and
+only the ranges missing from the journal are fetched
+
+	header: JOURNAL_MAGIC, version, TimeDateStamp, metadata size, CRC32 of the metadata, payload RVA and size
+	records: RVA and size of payload ranges written, in completion order
+
+the header is only written once everything before the payload is on disk. records are appended in batches after
+the dump file was synced, a record never covers bytes that could still be lost. the journal is removed once the
+dump is complete
+"""
+import bisect
+import logging
+import os
+import struct
+import threading
+
+JOURNAL_MAGIC = b"MDMPJRNL"
+JOURNAL_VERSION = 1
+JOURNAL_HEADER = struct.Struct("<8sIIQIQQ")
+JOURNAL_RECORD = struct.Struct("<QQ")
+
+class minidump_journal:
+	"""
+	sync_interval is the amount of payload bytes recorded between two syncs of the dump and the journal,
+	at most that much is fetched again after a failure
+	"""
+	def __init__(self, path, sync_interval=0x4000000):
+		self.path = path
+		self.sync_interval = sync_interval
+
+		self.time_date_stamp = None
+		self.metadata_size = None
+		self.metadata_crc = None
+		self.payload_rva = None
+		self.payload_size = None
+
+		# merged (start rva, end rva) ranges written by the previous run, sorted
+		self._completed = []
+		self._completed_starts = []
+		self._records_end = 0
+
+		self._journal_file = None
+		self._sync_output = None
+		# (rva, size) written since the last sync, the fetch threads record concurrently
+		self._pending = []
+		self._pending_bytes = 0
+		self._lock = threading.Lock()
+
+	def begin(self, time_date_stamp, metadata_size, metadata_crc, payload_rva, payload_size, sync_output):
+		"""
+		starts a new journal once everything before the payload was written, sync_output() makes
+		the bytes written to the dump so far durable
+		"""
+		self.time_date_stamp = time_date_stamp
+		self.metadata_size = metadata_size
+		self.metadata_crc = metadata_crc
+		self.payload_rva = payload_rva
+		self.payload_size = payload_size
+		self._sync_output = sync_output
+
+		sync_output()
+		self._journal_file = open(self.path, "wb")
+		self._journal_file.write(JOURNAL_HEADER.pack(JOURNAL_MAGIC, JOURNAL_VERSION, time_date_stamp, metadata_size, metadata_crc, payload_rva, payload_size))
+		self._flush_journal()
+
+	def load(self):
+		"""
+		reads the journal of a previous run, raises ValueError when there is nothing to resume
+		"""
+		try:
+			with open(self.path, "rb") as journal_file:
+				journal = journal_file.read()
+		except FileNotFoundError:
+			raise ValueError(f"No journal at {self.path}, the dump can't be resumed") from None
+
+		if len(journal) < JOURNAL_HEADER.size:
+			raise ValueError("The journal has no header, the previous run failed before the payload and has to be written again")
+
+		magic, version, self.time_date_stamp, self.metadata_size, self.metadata_crc, self.payload_rva, self.payload_size = JOURNAL_HEADER.unpack_from(journal)
+		if magic != JOURNAL_MAGIC or version != JOURNAL_VERSION:
+			raise ValueError("Not a minidump journal")
+
+		# a record torn by the failure is dropped, its range is fetched again
+		self._records_end = JOURNAL_HEADER.size + (len(journal) - JOURNAL_HEADER.size) // JOURNAL_RECORD.size * JOURNAL_RECORD.size
+
+		self._completed = []
+		for record_rva, record_size in sorted(JOURNAL_RECORD.iter_unpack(journal[JOURNAL_HEADER.size:self._records_end])):
+			if self._completed and self._completed[-1][1] >= record_rva:
+				self._completed[-1] = (self._completed[-1][0], max(self._completed[-1][1], record_rva + record_size))
+			else:
+				self._completed.append((record_rva, record_rva + record_size))
+
+		self._completed_starts = [completed_start for completed_start, _ in self._completed]
+
+	def resume(self, sync_output):
+		"""
+		appends to the loaded journal
+		"""
+		self._sync_output = sync_output
+		self._journal_file = open(self.path, "r+b")
+		self._journal_file.truncate(self._records_end)
+		self._journal_file.seek(self._records_end)
+
+	@property
+	def completed_bytes(self):
+		return sum(completed_end - completed_start for completed_start, completed_end in self._completed)
+
+	def missing(self, disk_rva, size):
+		"""
+		yields the (rva, size) parts of a payload range the previous run did not write
+		"""
+		end = disk_rva + size
+		position = disk_rva
+		completed_index = max(0, bisect.bisect_right(self._completed_starts, disk_rva) - 1)
+		while position < end and completed_index < len(self._completed):
+			completed_start, completed_end = self._completed[completed_index]
+			if completed_start >= end:
+				break
+
+			if completed_start > position:
+				yield position, completed_start - position
+
+			position = max(position, completed_end)
+			completed_index += 1
+
+		if position < end:
+			yield position, end - position
+
+	def record(self, disk_rva, size):
+		with self._lock:
+			if self._pending and self._pending[-1][0] + self._pending[-1][1] == disk_rva:
+				self._pending[-1] = (self._pending[-1][0], self._pending[-1][1] + size)
+			else:
+				self._pending.append((disk_rva, size))
+
+			self._pending_bytes += size
+			if self._pending_bytes >= self.sync_interval:
+				self._sync()
+
+	def _sync(self):
+		if not self._pending:
+			return
+
+		# the ranges have to be on disk before the journal says so
+		self._sync_output()
+		self._journal_file.write(b"".join(JOURNAL_RECORD.pack(record_rva, record_size) for record_rva, record_size in self._pending))
+		self._flush_journal()
+
+		self._pending = []
+		self._pending_bytes = 0
+
+	def _flush_journal(self):
+		self._journal_file.flush()
+		os.fsync(self._journal_file.fileno())
+
+	def close(self):
+		"""
+		records what is still pending and closes the journal, the write can be resumed from there
+		"""
+		if self._journal_file is None:
+			return
+
+		try:
+			with self._lock:
+				self._sync()
+		except OSError as e:
+			logging.warning(f"Could not record the last written ranges in the journal: {e}")
+		finally:
+			self._journal_file.close()
+			self._journal_file = None
+
+	def complete(self):
+		"""
+		the dump was written completely, the journal is removed
+		"""
+		if self._journal_file is not None:
+			self._journal_file.close()
+			self._journal_file = None
+
+		self._pending = []
+		self._pending_bytes = 0
+		os.remove(self.path)
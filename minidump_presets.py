@@ -0,0 +1,221 @@
+"""
+dump presets and memory predicates
+
+a preset picks which regions of get_memory_info reach the Memory64 payload, modeled on the MINIDUMP_TYPE
+the dump is tagged with:
+
+full - every descriptor (the default)
+no-image - everything except Image regions, the modules can be loaded from disk
+private-only - Private regions, heaps and stacks without mapped files and images
+normal - the stacks of the threads only, from the page of the stack pointer to the end of its region
+
+predicates are callables taking a region dict and returning whether it is kept, they narrow the preset
+further. region dicts have the get_memory_info keys with Protect, AllocationProtect and Type as strings
+("rw-", "Private") and Module set to the name of the module the region is in (None outside of modules).
+descriptor ranges outside of every region are treated as "rwx" Private regions.
+descriptors left adjacent by the selection are merged into one, see coalesce_ranges
+"""
+import bisect
+
+from minidump_enums import *
+from minidump_structs import *
+from minidump_columns import iter_memory_info, iter_memory_descriptors
+
+PRESET_PAGE_SIZE = 0x1000
+
+MemoryType_to_string_type = {value: string_type for string_type, value in string_type_to_MemoryType.items()}
+
+# PAGE_* protection values without the modifier bits (PAGE_GUARD, PAGE_NOCACHE...)
+MemoryProtection_to_string_protect = {
+	0x01: "---",
+	0x02: "r--",
+	0x04: "rw-",
+	0x08: "rw-", # PAGE_WRITECOPY
+	0x10: "--x",
+	0x20: "r-x",
+	0x40: "rwx",
+	0x80: "rwx", # PAGE_EXECUTE_WRITECOPY
+}
+
+stack_pointer_registers = ["Rsp", "Esp", "Sp"]
+
+def _protect_string(protect):
+	if isinstance(protect, str):
+		return protect
+
+	return MemoryProtection_to_string_protect.get(protect & 0xff, "---")
+
+class dump_preset:
+	def __init__(self, name, flags, region_filter=None, stacks_only=False):
+		self.name = name
+		self.flags = flags
+		self.region_filter = region_filter
+		self.stacks_only = stacks_only
+
+dump_presets = {
+	"full": dump_preset("full", MINIDUMP_TYPE.MiniDumpWithFullMemory | MINIDUMP_TYPE.MiniDumpIgnoreInaccessibleMemory),
+	"no-image": dump_preset("no-image", MINIDUMP_TYPE.MiniDumpWithPrivateReadWriteMemory | MINIDUMP_TYPE.MiniDumpIgnoreInaccessibleMemory,
+		lambda region: region["Type"] != "Image"),
+	"private-only": dump_preset("private-only", MINIDUMP_TYPE.MiniDumpWithPrivateReadWriteMemory | MINIDUMP_TYPE.MiniDumpIgnoreInaccessibleMemory,
+		lambda region: region["Type"] == "Private"),
+	"normal": dump_preset("normal", MINIDUMP_TYPE.MiniDumpNormal, stacks_only=True),
+}
+
+def region_type_in(*types):
+	return lambda region: region["Type"] in types
+
+def protect_has(permissions):
+	"""
+	keeps regions having every permission of permissions ("w", "rx")
+	"""
+	return lambda region: all(permission in region["Protect"] for permission in permissions)
+
+def in_modules(*names):
+	"""
+	keeps regions of the named modules, names are matched against the end of the module path case insensitively
+	"""
+	names = tuple(name.lower() for name in names)
+	return lambda region: region["Module"] is not None and region["Module"].lower().endswith(names)
+
+def size_at_most(size):
+	return lambda region: region["RegionSize"] <= size
+
+class coalesced_ranges:
+	"""
+	info of a descriptor merged from adjacent descriptors, parts holds the (range_start, range_size, info)
+	of every original descriptor so each part is fetched with its own info
+	"""
+	def __init__(self, parts):
+		self.parts = parts
+
+def iter_fetch_ranges(memory_descriptors):
+	"""
+	iter_memory_descriptors with coalesced descriptors split back into their parts
+	"""
+	for range_start, range_size, info in iter_memory_descriptors(memory_descriptors):
+		if isinstance(info, coalesced_ranges):
+			yield from info.parts
+		else:
+			yield range_start, range_size, info
+
+class _region_selector:
+	def __init__(self, memory_info, modules, threads, preset, predicates, arch=None):
+		# minidump_writer imports this module
+		from minidump_writer import context_stack_pointer
+
+
+		self.preset = preset
+		self.predicates = predicates
+
+		self.modules = sorted((module["BaseOfImage"], module["BaseOfImage"] + module["SizeOfImage"], module["ModuleName"]) for module in modules)
+		self.module_starts = [module_start for module_start, _, _ in self.modules]
+
+		self.stack_pointers = []
+		for thread_info in threads.values():
+			stack_pointer = context_stack_pointer(thread_info.get("Context", None), arch)
+			if stack_pointer is not None:
+				self.stack_pointers.append(stack_pointer)
+
+		self.stack_pointers.sort()
+
+		self.regions = sorted((self._region(info) for info in iter_memory_info(memory_info)), key=lambda region: region["BaseAddress"])
+		self.region_starts = [region["BaseAddress"] for region in self.regions]
+		self.region_kept = [self._kept_range(region) for region in self.regions]
+
+	def _region(self, info):
+		region = dict(info)
+		region["Protect"] = _protect_string(info.get("Protect", "rwx"))
+		region["AllocationProtect"] = _protect_string(info.get("AllocationProtect", region["Protect"]))
+		region["Type"] = info.get("Type", "Private")
+		if not isinstance(region["Type"], str):
+			region["Type"] = MemoryType_to_string_type.get(region["Type"], "Private")
+
+		region["Module"] = None
+		module_index = bisect.bisect_right(self.module_starts, region["BaseAddress"]) - 1
+		if module_index >= 0 and region["BaseAddress"] < self.modules[module_index][1]:
+			region["Module"] = self.modules[module_index][2]
+
+		return region
+
+	def _kept_range(self, region):
+		"""
+		(start, end) of the part of region that is dumped, or None
+		"""
+		region_start = region["BaseAddress"]
+		region_end = region_start + region["RegionSize"]
+
+		if self.preset.region_filter is not None and not self.preset.region_filter(region):
+			return None
+
+		if not all(predicate(region) for predicate in self.predicates):
+			return None
+
+		if self.preset.stacks_only:
+			# the stack grows down, everything from the stack pointer to the end of the region is in use
+			stack_index = bisect.bisect_left(self.stack_pointers, region_start)
+			if stack_index == len(self.stack_pointers) or self.stack_pointers[stack_index] >= region_end:
+				return None
+
+			region_start = max(region_start, self.stack_pointers[stack_index] // PRESET_PAGE_SIZE * PRESET_PAGE_SIZE)
+
+		return region_start, region_end
+
+	def _gap_kept_range(self, gap_start, gap_end):
+		return self._kept_range(self._region({"BaseAddress": gap_start, "RegionSize": gap_end - gap_start}))
+
+	def select(self, range_start, range_size, info):
+		"""
+		yields the kept (range_start, range_size, info) parts of a descriptor
+		"""
+		range_end = range_start + range_size
+		region_index = max(0, bisect.bisect_right(self.region_starts, range_start) - 1)
+		position = range_start
+		while position < range_end:
+			while region_index < len(self.regions) and self.region_starts[region_index] + self.regions[region_index]["RegionSize"] <= position:
+				region_index += 1
+
+			if region_index < len(self.regions) and self.region_starts[region_index] <= position:
+				piece_end = min(range_end, self.region_starts[region_index] + self.regions[region_index]["RegionSize"])
+				kept = self.region_kept[region_index]
+			else:
+				piece_end = range_end
+				if region_index < len(self.regions):
+					piece_end = min(range_end, self.region_starts[region_index])
+				kept = self._gap_kept_range(position, piece_end)
+
+			if kept is not None:
+				kept_start = max(position, kept[0])
+				kept_end = min(piece_end, kept[1])
+				if kept_start < kept_end:
+					yield kept_start, kept_end - kept_start, info
+
+			position = piece_end
+
+def select_memory(memory_descriptors, memory_info, modules, threads, preset, predicates=(), arch=None):
+	"""
+	applies preset and predicates to memory_descriptors, returns a descriptor list with adjacent
+	kept ranges coalesced. arch (a ProcessorArchitecture value) finds the stack pointer of threads
+	whose Context is raw CONTEXT bytes
+	"""
+	selector = _region_selector(memory_info, modules, threads, preset, predicates, arch)
+
+	return coalesce_ranges(part for range_start, range_size, info in iter_fetch_ranges(memory_descriptors) for part in selector.select(range_start, range_size, info))
+
+def coalesce_ranges(parts):
+	"""
+	returns a descriptor list of the (range_start, range_size, info) parts in their order, with
+	adjacent parts merged into one descriptor
+	"""
+	coalesced = []
+	for part in parts:
+		if coalesced and coalesced[-1][0] + coalesced[-1][1] == part[0]:
+			previous_start, previous_size, previous_info = coalesced[-1]
+			if not isinstance(previous_info, coalesced_ranges):
+				previous_info = coalesced_ranges([coalesced[-1]])
+
+			previous_info.parts.append(part)
+			coalesced[-1] = (previous_start, previous_size + part[1], previous_info)
+		else:
+			coalesced.append(part)
+
+	return coalesced
@@ -0,0 +1,316 @@
+from array import array
+import bisect
+import ctypes
+import itertools
+import mmap
+
+from minidump_enums import *
+from minidump_structs import *
+from minidump_writer import minidump_provider, arch_to_context
+
+ProcessorArchitecture_to_arch = {value: arch for arch, value in arch_to_ProcessorArchitecture.items()}
+MemoryType_to_string_type = {value: string_type for string_type, value in string_type_to_MemoryType.items()}
+
+class minidump_reader(minidump_provider):
+	"""
+	memory maps a dump written by minidump_writer and parses its streams lazily.
+	the get_* methods return the same shapes the provider interface expects, so a reader can be
+	passed anywhere a provider is needed (re-writing, verification).
+	memory is returned as zero-copy memoryview slices of the map, release them before close()
+	"""
+	def __init__(self, path):
+		self._dump_file = open(path, "rb")
+		self._map = mmap.mmap(self._dump_file.fileno(), 0, access=mmap.ACCESS_READ)
+		self._view = memoryview(self._map)
+		self._cache = {}
+
+		self.dump_header = self._struct(MINIDUMP_HEADER, 0)
+		if self.dump_header.Signature != 0x504D444D:
+			raise ValueError("Not a minidump file")
+
+		self.stream_directories = {}
+		for stream_index in range(self.dump_header.NumberOfStreams):
+			directory = self._struct(MINIDUMP_DIRECTORY, self.dump_header.StreamDirectoryRva + stream_index * MINIDUMP_DIRECTORY.size())
+			self.stream_directories[directory.StreamType] = directory
+
+	def close(self):
+		self._view.release()
+		self._map.close()
+		self._dump_file.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.close()
+
+	def _struct(self, struct_class, rva):
+		if rva + struct_class.size() > len(self._map):
+			raise ValueError(f"{struct_class.__name__} at {rva:#x} is out of the file")
+
+		return struct_class.from_buffer_copy(self._map, rva)
+
+	def _string(self, rva):
+		length = self._struct(MINIDUMP_STRING, rva).Length
+		string_rva = rva + MINIDUMP_STRING.size()
+		return bytes(self._view[string_rva:string_rva + length]).decode("utf-16-le").rstrip("\x00")
+
+	def _stream(self, stream_type):
+		return self.stream_directories.get(stream_type.value, None)
+
+	def _cached(self, name, parser):
+		if name not in self._cache:
+			self._cache[name] = parser()
+
+		return self._cache[name]
+
+	def get_system_info(self):
+		return self._cached("system_info", self._parse_system_info)
+
+	def _parse_system_info(self):
+		directory = self._stream(MINIDUMP_STREAM_TYPE.SystemInfoStream)
+		if directory is None:
+			return None
+
+		system_info_struct = self._struct(MINIDUMP_SYSTEM_INFO, directory.Location.Rva)
+		to_return = {}
+		to_return["ProcessorArchitecture"] = ProcessorArchitecture_to_arch.get(system_info_struct.ProcessorArchitecture, "unknown")
+		to_return["ProcessorLevel"] = system_info_struct.ProcessorLevel
+		to_return["ProcessorRevision"] = system_info_struct.ProcessorRevision
+		to_return["MajorVersion"] = system_info_struct.MajorVersion
+		to_return["MinorVersion"] = system_info_struct.MinorVersion
+		to_return["BuildNumber"] = system_info_struct.BuildNumber
+		to_return["NumberOfProcessors"] = system_info_struct.NumberOfProcessors
+		to_return["ProductType"] = system_info_struct.ProductType
+		to_return["PlatformId"] = system_info_struct.PlatformId
+		to_return["CSDVersion"] = self._string(system_info_struct.CSDVersionRva)
+
+		return to_return
+
+	def get_modules(self):
+		return self._cached("modules", self._parse_modules)
+
+	def _parse_modules(self):
+		directory = self._stream(MINIDUMP_STREAM_TYPE.ModuleListStream)
+		if directory is None:
+			return []
+
+		list_of_modules = []
+		number_of_modules = self._struct(MINIDUMP_MODULE_LIST, directory.Location.Rva).NumberOfModules
+		for module_index in range(number_of_modules):
+			module_struct = self._struct(MINIDUMP_MODULE, directory.Location.Rva + MINIDUMP_MODULE_LIST.size() + module_index * MINIDUMP_MODULE.size())
+			current_module = {}
+			current_module["BaseOfImage"] = module_struct.BaseOfImage
+			current_module["SizeOfImage"] = module_struct.SizeOfImage
+			current_module["ModuleName"] = self._string(module_struct.ModuleNameRva)
+			current_module["TimeDateStamp"] = module_struct.TimeDateStamp
+			list_of_modules.append(current_module)
+
+		return list_of_modules
+
+	def get_threads(self):
+		return self._cached("threads", self._parse_threads)
+
+	def _parse_threads(self):
+		directory = self._stream(MINIDUMP_STREAM_TYPE.ThreadListStream)
+		if directory is None:
+			return {}
+
+		threads = {}
+		number_of_threads = self._struct(MINIDUMP_THREAD_LIST, directory.Location.Rva).NumberOfThreads
+		for thread_index in range(number_of_threads):
+			thread_struct = self._struct(MINIDUMP_THREAD, directory.Location.Rva + MINIDUMP_THREAD_LIST.size() + thread_index * MINIDUMP_THREAD.size())
+			thread_info = {}
+			thread_info["PriorityClass"] = thread_struct.PriorityClass
+			thread_info["Priority"] = thread_struct.Priority
+			thread_info["Teb"] = thread_struct.Teb
+
+			if thread_struct.ThreadContext.DataSize:
+				thread_info["Context"] = self._context(thread_struct.ThreadContext)
+
+			if thread_struct.Stack.Memory.DataSize:
+				thread_info["Stack"] = (thread_struct.Stack.StartOfMemoryRange, thread_struct.Stack.Memory.DataSize)
+
+			threads[thread_struct.ThreadId] = thread_info
+
+		return threads
+
+	def _context(self, location):
+		arch = self.get_system_info()["ProcessorArchitecture"]
+		context_class = CONTEXT64 if arch == "ia64" else arch_to_context.get(arch_to_ProcessorArchitecture.get(arch, None), CONTEXT32)
+		if location.DataSize < context_class.size():
+			return None
+
+		context_struct = self._struct(context_class, location.Rva)
+		context = {}
+		for field_name, field_type in context_struct._fields_:
+			if issubclass(field_type, ctypes._SimpleCData):
+				context[field_name] = getattr(context_struct, field_name)
+
+		return context
+
+	def get_thread_stack(self, thread_id):
+		"""
+		zero-copy view of the stack captured for thread_id in the MemoryListStream, or None
+		"""
+		directory = self._stream(MINIDUMP_STREAM_TYPE.ThreadListStream)
+		if directory is None:
+			return None
+
+		number_of_threads = self._struct(MINIDUMP_THREAD_LIST, directory.Location.Rva).NumberOfThreads
+		for thread_index in range(number_of_threads):
+			thread_struct = self._struct(MINIDUMP_THREAD, directory.Location.Rva + MINIDUMP_THREAD_LIST.size() + thread_index * MINIDUMP_THREAD.size())
+			if thread_struct.ThreadId == thread_id and thread_struct.Stack.Memory.DataSize:
+				return self._view[thread_struct.Stack.Memory.Rva:thread_struct.Stack.Memory.Rva + thread_struct.Stack.Memory.DataSize]
+
+		return None
+
+	def get_memory_info(self):
+		return self._cached("memory_info", self._parse_memory_info)
+
+	def _parse_memory_info(self):
+		directory = self._stream(MINIDUMP_STREAM_TYPE.MemoryInfoListStream)
+		if directory is None:
+			return []
+
+		memory_info = []
+		memory_info_list_struct = self._struct(MINIDUMP_MEMORY_INFO_LIST, directory.Location.Rva)
+		for memory_info_index in range(memory_info_list_struct.NumberOfEntries):
+			memory_info_struct = self._struct(MINIDUMP_MEMORY_INFO, directory.Location.Rva + memory_info_list_struct.SizeOfHeader + memory_info_index * memory_info_list_struct.SizeOfEntry)
+			info = {}
+			info["BaseAddress"] = memory_info_struct.BaseAddress
+			info["AllocationBase"] = memory_info_struct.AllocationBase
+			info["AllocationProtect"] = memory_info_struct.AllocationProtect
+			info["Protect"] = memory_info_struct.Protect
+			info["RegionSize"] = memory_info_struct.RegionSize
+			info["State"] = memory_info_struct.State
+			info["Type"] = MemoryType_to_string_type.get(memory_info_struct.Type, "Private")
+			memory_info.append(info)
+
+		return memory_info
+
+	def _memory_index(self):
+		return self._cached("memory_index", self._build_memory_index)
+
+	def _build_memory_index(self):
+		"""
+		sorted (starts, sizes, file offsets) of the Memory64 ranges and of the parts of the MemoryListStream
+		ranges (thread stacks) the Memory64 ranges don't cover
+		"""
+		starts, sizes, file_offsets = self._memory64_ranges()
+		list_ranges = self._memory_list_ranges(starts, sizes)
+		if not list_ranges:
+			return starts, sizes, file_offsets
+
+		ranges = sorted(itertools.chain(zip(starts, sizes, file_offsets), list_ranges))
+		return array("Q", [range_start for range_start, _, _ in ranges]), array("Q", [range_size for _, range_size, _ in ranges]), array("Q", [file_offset for _, _, file_offset in ranges])
+
+	def _memory64_ranges(self):
+		directory = self._stream(MINIDUMP_STREAM_TYPE.Memory64ListStream)
+		if directory is None:
+			return array("Q"), array("Q"), array("Q")
+
+		memory64_list_struct = self._struct(MINIDUMP_MEMORY64_LIST, directory.Location.Rva)
+		number_of_ranges = memory64_list_struct.NumberOfMemoryRanges
+		descriptors_rva = directory.Location.Rva + MINIDUMP_MEMORY64_LIST.size()
+		descriptors_end = descriptors_rva + number_of_ranges * MINIDUMP_MEMORY_DESCRIPTOR64.size()
+		if descriptors_end > len(self._map):
+			raise ValueError("Memory64 descriptors are out of the file")
+
+		descriptors = array("Q")
+		descriptors.frombytes(self._view[descriptors_rva:descriptors_end])
+		starts = descriptors[0::2]
+		sizes = descriptors[1::2]
+
+		# the payload is contiguous in descriptor order
+		file_offsets = array("Q", itertools.accumulate(sizes[:-1], initial=memory64_list_struct.BaseRva))
+		if number_of_ranges == 0:
+			file_offsets = array("Q")
+
+		if any(starts[range_index] > starts[range_index + 1] for range_index in range(number_of_ranges - 1)):
+			order = sorted(range(number_of_ranges), key=starts.__getitem__)
+			starts = array("Q", [starts[range_index] for range_index in order])
+			sizes = array("Q", [sizes[range_index] for range_index in order])
+			file_offsets = array("Q", [file_offsets[range_index] for range_index in order])
+
+		return starts, sizes, file_offsets
+
+	def _memory_list_ranges(self, starts, sizes):
+		"""
+		(range_start, range_size, file offset) of the MemoryListStream ranges, without the parts already in
+		the sorted Memory64 ranges starts and sizes
+		"""
+		directory = self._stream(MINIDUMP_STREAM_TYPE.MemoryListStream)
+		if directory is None:
+			return []
+
+		number_of_ranges = self._struct(MINIDUMP_MEMORY_LIST, directory.Location.Rva).NumberOfMemoryRanges
+		list_ranges = []
+		for descriptor_index in range(number_of_ranges):
+			descriptor = self._struct(MINIDUMP_MEMORY_DESCRIPTOR, directory.Location.Rva + MINIDUMP_MEMORY_LIST.size() + descriptor_index * MINIDUMP_MEMORY_DESCRIPTOR.size())
+			position = descriptor.StartOfMemoryRange
+			end = position + descriptor.Memory.DataSize
+			range_index = max(0, bisect.bisect_right(starts, position) - 1)
+			while position < end:
+				if range_index < len(starts) and starts[range_index] + sizes[range_index] <= position:
+					range_index += 1
+					continue
+
+				# up to the next Memory64 range, or past the one position is in
+				if range_index >= len(starts) or starts[range_index] >= end:
+					gap_end = end
+				else:
+					gap_end = max(position, starts[range_index])
+
+				if gap_end > position:
+					list_ranges.append((position, gap_end - position, descriptor.Memory.Rva + position - descriptor.StartOfMemoryRange))
+
+				if range_index < len(starts) and starts[range_index] < end:
+					position = max(gap_end, starts[range_index] + sizes[range_index])
+					range_index += 1
+				else:
+					position = end
+
+		return list_ranges
+
+	def get_memory_descriptors(self):
+		"""
+		(range_start, range_size, file offset) sorted by address
+		"""
+		return list(zip(*self._memory_index()))
+
+	def find(self, address):
+		"""
+		returns the (range_start, range_size, file offset) containing address, or None
+		"""
+		starts, sizes, file_offsets = self._memory_index()
+		range_index = bisect.bisect_right(starts, address) - 1
+		if range_index < 0 or address >= starts[range_index] + sizes[range_index]:
+			return None
+
+		return starts[range_index], sizes[range_index], file_offsets[range_index]
+
+	def read_memory(self, address, size):
+		"""
+		zero-copy view of size bytes at address. ranges that are adjacent both in memory and in the
+		file (consecutive descriptors of split regions) are read across, anything else raises KeyError
+		"""
+		starts, sizes, file_offsets = self._memory_index()
+		range_index = bisect.bisect_right(starts, address) - 1
+		if range_index < 0 or address >= starts[range_index] + sizes[range_index]:
+			raise KeyError(f"{address:#x} is not in the dump")
+
+		file_offset = file_offsets[range_index] + (address - starts[range_index])
+		available = starts[range_index] + sizes[range_index] - address
+		while available < size:
+			range_index += 1
+			if range_index >= len(starts) or starts[range_index] != starts[range_index - 1] + sizes[range_index - 1] or \
+					file_offsets[range_index] != file_offsets[range_index - 1] + sizes[range_index - 1]:
+				raise KeyError(f"{address:#x}+{size:#x} is not contiguous in the dump")
+
+			available += sizes[range_index]
+
+		return self._view[file_offset:file_offset + size]
+
+	def get_bytes(self, address, size, info):
+		return self.read_memory(address, size)
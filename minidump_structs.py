@@ -138,6 +138,12 @@ class MINIDUMP_MEMORY_DESCRIPTOR(generic_file_structure, Structure):
 		("Memory", MINIDUMP_LOCATION_DESCRIPTOR),
 	]
 
+class MINIDUMP_MEMORY_LIST(generic_file_structure, Structure):
+	_fields_ = [
+		("NumberOfMemoryRanges", ULONG32),
+		#   MINIDUMP_MEMORY_DESCRIPTOR MemoryRanges[0];
+	]
+
 class MINIDUMP_MEMORY_DESCRIPTOR64(generic_file_structure, Structure):
 	_fields_ = [
 		("StartOfMemoryRange", ULONG64),
@@ -379,4 +385,21 @@ class CONTEXT32(generic_file_structure, Structure):
         ("SegSs", DWORD),
         ("ExtendedRegisters", BYTE * (512)),
     ]
-    
\ No newline at end of file
+
+class CONTEXT_ARM64(generic_file_structure, Structure):
+    _fields_ = [
+        ("ContextFlags", DWORD),
+        ("Cpsr", DWORD),
+    ] + [("X%d" % register_index, DWORD64) for register_index in range(29)] + [
+        ("Fp", DWORD64),
+        ("Lr", DWORD64),
+        ("Sp", DWORD64),
+        ("Pc", DWORD64),
+        ("V", M128A * (32)),
+        ("Fpcr", DWORD),
+        ("Fpsr", DWORD),
+        ("Bcr", DWORD * (8)),
+        ("Bvr", DWORD64 * (8)),
+        ("Wcr", DWORD * (2)),
+        ("Wvr", DWORD64 * (2)),
+    ]
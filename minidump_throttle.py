@@ -0,0 +1,121 @@
+"""
+throttling of the memory fetch path
+
+a dump competes with the dumped process for memory bandwidth and CPU. read_throttle bounds that impact:
+
+rate - bytes per second read from the provider (token bucket), None for no limit
+burst - bytes that may be read at once after the fetchers were idle, one second of rate by default
+yield_interval - seconds the fetcher pauses after every chunk, 0 only gives up the CPU, None never pauses
+adaptive - backs off when read latency rises above latency_factor times the lowest latency seen: the rate is
+	halved (not below min_rate, which bounds how long the dump takes) and grows back by 10% per adjust_interval
+	while the latency stays low
+
+reserve() does not block, it returns how long to wait so both the threaded and the async fetchers can use it
+"""
+import os
+import threading
+import time
+
+class read_throttle:
+	def __init__(self, rate=None, burst=None, yield_interval=None, adaptive=False, latency_factor=2.0, min_rate=0x100000, adjust_interval=0.1):
+		self.max_rate = rate
+		self.rate = rate
+		# without a burst one second of the current rate is allowed
+		self._given_burst = burst
+		self.burst = burst if burst is not None else rate
+
+		self.yield_interval = yield_interval
+		self.adaptive = adaptive
+		self.latency_factor = latency_factor
+		self.min_rate = min_rate
+		self.adjust_interval = adjust_interval
+
+		# shared by the fetch threads
+		self._lock = threading.Lock()
+		self._tokens = self.burst or 0
+		self._last_refill = time.monotonic()
+
+		# per byte read latencies, moving average and lowest seen
+		self._latency = None
+		self._lowest_latency = None
+		self._throughput = None
+		self._last_adjust = 0.0
+
+	def reserve(self, size):
+		"""
+		takes size bytes from the bucket, returns the seconds to wait before reading them
+		"""
+		with self._lock:
+			if self.rate is None:
+				return 0.0
+
+			now = time.monotonic()
+			self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate)
+			self._last_refill = now
+
+			# the bucket goes into debt, later readers wait for it to be paid back as well
+			self._tokens -= size
+			if self._tokens >= 0:
+				return 0.0
+
+			return -self._tokens / self.rate
+
+	def pause(self):
+		"""
+		the pause between two chunks
+		"""
+		if self.yield_interval is None:
+			return
+
+		if self.yield_interval > 0:
+			time.sleep(self.yield_interval)
+		elif hasattr(os, "sched_yield"):
+			os.sched_yield()
+		else:
+			time.sleep(0)
+
+	def wait(self, size):
+		delay = self.reserve(size)
+		if delay > 0:
+			time.sleep(delay)
+
+	def record_read(self, seconds, size):
+		if not self.adaptive or size == 0:
+			return
+
+		latency = seconds / size
+		with self._lock:
+			if self._latency is None:
+				self._latency = latency
+				self._lowest_latency = latency
+				self._throughput = size / max(seconds, 1e-9)
+			else:
+				self._latency = self._latency * 0.8 + latency * 0.2
+				self._lowest_latency = min(self._lowest_latency, latency)
+				self._throughput = self._throughput * 0.8 + size / max(seconds, 1e-9) * 0.2
+
+			now = time.monotonic()
+			if now - self._last_adjust < self.adjust_interval:
+				return
+
+			self._last_adjust = now
+			if self._latency > self._lowest_latency * self.latency_factor:
+				# an unlimited throttle starts backing off from the rate reads were coming in at
+				current_rate = self.rate if self.rate is not None else self._throughput
+				self._set_rate(max(self.min_rate, current_rate / 2))
+			elif self.rate is not None:
+				rate = self.rate * 1.1
+				if self.max_rate is not None:
+					rate = min(rate, self.max_rate)
+
+				self._set_rate(rate)
+
+	def _set_rate(self, rate):
+		if self.rate is None:
+			self._tokens = 0
+			self._last_refill = time.monotonic()
+
+		self.rate = rate
+		if self._given_burst is None:
+			self.burst = rate
+			self._tokens = min(self._tokens, self.burst)
@@ -1,10 +1,26 @@
 from abc import ABC, abstractmethod
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import bisect
+import ctypes
+import errno
+import io
+import mmap
+import os
+import stat
+import struct
+import threading
 import time
+import zlib
 import pdb
 
 from minidump_enums import *
 from minidump_structs import *
+from minidump_columns import is_columnar, table_length, memory_info_table, memory_descriptor_table
+from minidump_delta import minidump_delta_encoder
+from minidump_compress import block_compressor
+from minidump_presets import dump_presets, select_memory, coalesce_ranges, iter_fetch_ranges, stack_pointer_registers
+from minidump_journal import minidump_journal
 import logging
 
 
@@ -18,7 +34,7 @@ class minidump_provider(ABC):
 		"""
 		get generic system information
 
-		ProcessorArchitecture - one of (amd64, arm, ia64, intel)
+		ProcessorArchitecture - one of (amd64, arm, arm64, ia64, intel)
 		ProcessorLevel - Optional, default to INTEL_PRO_OR_PENTIUM_2 from ProcessorLevel enum
 		ProcessorRevision - Optional, default to const 0x5E03
 		MajorVersion
@@ -62,7 +78,8 @@ class minidump_provider(ABC):
 		ThreadId :{ PriorityClass - Optional
 					Priority - Optional
 					Teb - Optional
-					Context - Optional -> Dict of registers ({"Rip": 1})
+					Context - Optional -> Dict of registers ({"Rip": 1}) or the raw CONTEXT as bytes
+					Stack - Optional, (start, size) of the used stack, defaults to the stack pointer up to the end of its memory range
 		}
 		"""
 
@@ -79,34 +96,372 @@ class minidump_provider(ABC):
 		"""
 		reads addresses that were received from `get_memory_descriptors`
 		info is used to pass information to the get_bytes function so you can calculate some logic once
+		raise unreadable_memory_error when part of the range can't be read, the writer then reads the range
+		again in halves down to single pages and zero fills only the pages that fail
 		"""
 
+	def take_snapshot(self):
+		"""
+		optional, enumerates the process once at the start of write(). the result is kept in self.snapshot
+		while the dump is written, so get_modules, get_memory_info, get_threads and get_memory_descriptors
+		can derive from the same view instead of querying the OS again
+		"""
+		return None
+
+	def probe_readable(self, address, size, info):
+		"""
+		optional, returns the (address, size) parts of the range that can be read, for probe_memory.
+		answer from what is known without reading (protections, mappings), return None to let the writer
+		find the parts by reading the range
+		"""
+		return None
+
+	def get_file_backing(self, address, size, info):
+		"""
+		optional, returns (fileno, offset) when the range is stored as-is in a file (core files, raw images).
+		the writer then moves it into the dump with copy_file_range / sendfile so the bytes never pass through python.
+		return None to read the range with `get_bytes_into` / `get_bytes`
+		"""
+		return None
+
+	def get_bytes_into(self, address, buffer, info):
+		"""
+		optional zero-copy variant of `get_bytes`, fills the writable memoryview buffer with len(buffer) bytes
+		read from address and returns the amount of bytes filled.
+		the buffer is reused by the writer once it was written, so don't keep references to it.
+		with mmap_output the buffer is the destination of the range in the mapped dump itself.
+		may raise unreadable_memory_error like `get_bytes`.
+		return None if not supported, the writer falls back to `get_bytes`
+		"""
+		return None
+
+class unreadable_memory_error(OSError):
+	"""
+	raised by providers when a range can't be read
+	"""
+	def __init__(self, address, size):
+		super().__init__(f"{size:#x} bytes at {address:#x} can't be read")
+		self.address = address
+		self.size = size
+
+arch_to_context = {
+	ProcessorArchitecture.PROCESSOR_ARCHITECTURE_INTEL.value: CONTEXT32,
+	ProcessorArchitecture.PROCESSOR_ARCHITECTURE_AMD64.value: CONTEXT64,
+	ProcessorArchitecture.PROCESSOR_ARCHITECTURE_ARM64.value: CONTEXT_ARM64,
+}
+
+# other names providers use for the same registers
+context_register_aliases = {
+	CONTEXT_ARM64: {"X29": "Fp", "X30": "Lr"},
+}
+
+def _context_layout(context_struct_class):
+	"""
+	register name -> (struct.Struct, offset, mask) of every scalar field, non scalar fields (arrays, unions) map
+	to None and are set through ctypes
+	"""
+	layout = {}
+	for field_name, field_type in context_struct_class._fields_:
+		if issubclass(field_type, ctypes._SimpleCData):
+			# unsigned by size, the _type_ codes of ctypes are native sized ("L" is 8 bytes on Linux)
+			field_struct = struct.Struct("<" + {1: "B", 2: "H", 4: "I", 8: "Q"}[ctypes.sizeof(field_type)])
+			# values are truncated to the field like a ctypes assignment would
+			layout[field_name] = (field_struct, getattr(context_struct_class, field_name).offset, (1 << (field_struct.size * 8)) - 1)
+		else:
+			layout[field_name] = None
+
+	for alias, field_name in context_register_aliases.get(context_struct_class, {}).items():
+		layout[alias] = layout[field_name]
+
+	return layout
+
+# computed once per architecture instead of walking _fields_ for every thread
+_context_layouts = {arch: (context_struct_class, _context_layout(context_struct_class)) for arch, context_struct_class in arch_to_context.items()}
+
+# (arch, register names) -> (struct.Struct packing the whole CONTEXT, (register name, mask) in pack order, non scalar register names)
+_context_packers = {}
+
+def _context_packer(arch, register_names):
+	context_struct_class, layout = _context_layouts[arch]
+	# field offset -> (struct.Struct, register name, mask)
+	scalar_registers = {}
+	other_registers = []
+	for register_name in register_names:
+		if register_name not in layout:
+			continue
+
+		if layout[register_name] is None:
+			other_registers.append(register_name)
+		else:
+			field_struct, field_offset, field_mask = layout[register_name]
+			# an alias of a register that is given as well replaces it, the later one wins like the ctypes assignment did
+			scalar_registers[field_offset] = (field_struct, register_name, field_mask)
+
+	# one format for the whole CONTEXT, the registers that aren't given are zero padding
+	context_format = "<"
+	format_offset = 0
+	pack_order = []
+	for field_offset, (field_struct, register_name, field_mask) in sorted(scalar_registers.items()):
+		context_format += f"{field_offset - format_offset}x{field_struct.format[1:]}"
+		format_offset = field_offset + field_struct.size
+		pack_order.append((register_name, field_mask))
+
+	context_format += f"{context_struct_class.size() - format_offset}x"
+	return struct.Struct(context_format), tuple(pack_order), other_registers
+
+def context_stack_pointer(context, arch=None):
+	"""
+	the stack pointer of a provider thread context, None when it has none. context is a dict of registers or
+	the raw CONTEXT as bytes-like, which needs arch (a ProcessorArchitecture value) to find the register
+	"""
+	if not context:
+		return None
+
+	if isinstance(context, (bytes, bytearray, memoryview)):
+		if arch not in _context_layouts:
+			return None
+
+		_, layout = _context_layouts[arch]
+		for register in stack_pointer_registers:
+			if layout.get(register) is not None:
+				field_struct, field_offset, _ = layout[register]
+				if field_offset + field_struct.size > len(context):
+					return None
+
+				return field_struct.unpack_from(context, field_offset)[0]
+
+		return None
+
+	for register in stack_pointer_registers:
+		if register in context:
+			return context[register]
+
+	return None
+
 def _context_from_provider_context(context, arch):
+	"""
+	returns the CONTEXT of arch as a bytes-like. context is a dict of registers, or the raw CONTEXT as
+	bytes-like which is passed through as is
+	"""
 	if context is None:
 		return None
 
-	arch_to_context = {
-		ProcessorArchitecture.PROCESSOR_ARCHITECTURE_INTEL.value: CONTEXT32,
-		ProcessorArchitecture.PROCESSOR_ARCHITECTURE_AMD64.value: CONTEXT64
-	}
+	if isinstance(context, (bytes, bytearray, memoryview)):
+		return context
 
-	context_struct_class = arch_to_context.get(arch, None)
-	if context_struct_class is None:
+	if arch not in _context_layouts:
 		logging.warning(f"Context object for {arch} is not defined")
 
 		return None
 
-	context_struct = context_struct_class()
-	for field in context_struct._fields_:
-		field_name = field[0]
-		if field_name in context:
-			setattr(context_struct, field_name, context[field_name])
+	# the threads of a process give the same registers, the packer is compiled once for all of them
+	packer_key = (arch, tuple(context))
+	packer = _context_packers.get(packer_key, None)
+	if packer is None:
+		packer = _context_packers[packer_key] = _context_packer(arch, packer_key[1])
+
+	context_struct, pack_order, other_registers = packer
+	context_bytes = context_struct.pack(*[context[register_name] & register_mask for register_name, register_mask in pack_order])
+	if not other_registers:
+		return context_bytes
+
+	context_buffer = bytearray(context_bytes)
+	context_struct_instance = _context_layouts[arch][0].from_buffer(context_buffer)
+	for register_name in other_registers:
+		setattr(context_struct_instance, register_name, context[register_name])
+
+	return context_buffer
+
+SPARSE_PAGE_SIZE = 0x1000
+# stacks derived from the stack pointer are cut at this size
+MAX_STACK_SIZE = 0x800000
+# the parallel fetcher hands chunks smaller than this to the threads in batches of about this size,
+# a task per small region costs more than reading it
+PARALLEL_BATCH_SIZE = 0x100000
+_ZERO_PAGE = bytes(SPARSE_PAGE_SIZE)
+
+class _in_flight_limiter:
+	"""
+	bounds the amount of bytes fetched but not yet written by the parallel fetcher.
+	a single request larger than the limit is let through once nothing else is in flight
+	"""
+	def __init__(self, max_bytes):
+		self._max_bytes = max_bytes
+		self._in_flight = 0
+		self._condition = threading.Condition()
+
+	def acquire(self, amount):
+		with self._condition:
+			while self._in_flight > 0 and self._in_flight + amount > self._max_bytes:
+				self._condition.wait()
+
+			self._in_flight += amount
+
+	def release(self, amount):
+		with self._condition:
+			self._in_flight -= amount
+			self._condition.notify_all()
+
+def _add_readable_part(readable_parts, part_address, part_size, data):
+	# parts that could be read (data isn't None) are merged with the part they follow
+	if data is None:
+		return
+
+	if readable_parts and readable_parts[-1][0] + readable_parts[-1][1] == part_address:
+		readable_parts[-1] = (readable_parts[-1][0], readable_parts[-1][1] + part_size)
+	else:
+		readable_parts.append((part_address, part_size))
+
+class _chunk_size_tuner:
+	"""
+	adaptive chunk size: doubles while the read throughput improves, steps back and stays there for a while
+	when it doesn't, halves on unreadable chunks. sizes are pages between min_size and max_size
+	"""
+	# reads measured before the size is changed
+	WINDOW = 4
+	# windows a size is kept after stepping back, before growing is tried again
+	SETTLE_WINDOWS = 16
+
+	def __init__(self, initial_size, min_size=SPARSE_PAGE_SIZE, max_size=0x1000000):
+		self.size = max(min_size, initial_size // min_size * min_size)
+		self.min_size = min_size
+		self.max_size = max_size
+
+		# shared by the fetch threads
+		self._lock = threading.Lock()
+		self._reads = 0
+		self._bytes = 0
+		self._seconds = 0.0
+		# throughput of the size before the last doubling
+		self._previous_throughput = None
+		self._settle = 0
+
+	def record(self, size, seconds):
+		with self._lock:
+			self._reads += 1
+			self._bytes += size
+			self._seconds += seconds
+			if self._reads < self.WINDOW:
+				return
+
+			throughput = self._bytes / max(self._seconds, 1e-9)
+			self._reads = 0
+			self._bytes = 0
+			self._seconds = 0.0
+
+			if self._previous_throughput is not None:
+				grew_faster = throughput >= self._previous_throughput * 1.05
+				self._previous_throughput = None
+				if not grew_faster:
+					self.size = max(self.min_size, self.size // 2)
+					self._settle = self.SETTLE_WINDOWS
+					return
+			elif self._settle > 0:
+				self._settle -= 1
+				return
+
+			if self.size < self.max_size:
+				self._previous_throughput = throughput
+				self.size = min(self.max_size, self.size * 2)
+
+	def fault(self):
+		with self._lock:
+			self.size = max(self.min_size, self.size // 2)
+			self._previous_throughput = None
+			self._settle = self.SETTLE_WINDOWS
+			self._reads = 0
+			self._bytes = 0
+			self._seconds = 0.0
+
+class _buffer_pool:
+	"""
+	a few preallocated buffers cycled by the memory fetcher for get_bytes_into.
+	buffers grow when a bigger chunk is requested (whole range reads)
+	"""
+	def __init__(self, buffer_size, count):
+		self._buffers = [bytearray(buffer_size) for _ in range(count)]
+		self._condition = threading.Condition()
+
+	def acquire(self, size):
+		with self._condition:
+			while not self._buffers:
+				self._condition.wait()
+
+			buffer = self._buffers.pop()
+
+		if len(buffer) < size:
+			buffer = bytearray(size)
+
+		return buffer
 
-	return context_struct
+	def release(self, buffer):
+		with self._condition:
+			self._buffers.append(buffer)
+			self._condition.notify()
 
 class minidump_writer:
-	def __init__(self, file, chunk_size=0x10000):
+	"""
+	file only has to provide write(), the dump is emitted front to back without seeking or reading,
+	so pipes, sockets (anything with sendall) and compressors can be written to directly.
+	write() may return the amount of bytes written, short writes are retried with the remainder
+
+	chunk_size is the amount of bytes read from the provider at once, -1 reads whole ranges. "auto" tunes it
+	while the payload is fetched: it grows while bigger reads are faster and shrinks on unreadable chunks.
+	a chunk that raises unreadable_memory_error is read again in halves down to pages, only the pages that
+	can't be read are zero filled (unreadable_bytes counts them)
+
+	fetch_threads > 1 fetches memory chunks concurrently and places them with os.pwrite at their RVAs,
+	this needs a real seekable file (fileno()). max_in_flight bounds the bytes read but not yet written
+
+	sparse=True skips zero-filled pages of the memory payload instead of writing them, the file length is set
+	up front so the skipped pages become holes. needs a seekable file, sparse_bytes_skipped holds the elided amount
+
+	baseline (a path or minidump_reader of a previous dump of the same process) writes a delta instead of a full
+	dump: only pages that differ from the baseline are stored, see minidump_delta.materialize
+
+	compression ("zlib" or "lzma") writes a block compressed container, blocks are compressed by
+	compression_threads threads (all cores by default), see minidump_compress.block_compressed_reader
+
+	preset ("full", "no-image", "private-only", "normal") and memory_filters (region predicates) select
+	which parts of the memory descriptors are dumped, see minidump_presets. the header Flags follow the preset
+
+	thread_stacks=True copies the stack of every thread into a MemoryListStream and links it from MINIDUMP_THREAD.Stack,
+	with the "normal" preset the stacks are then left out of the Memory64 payload
+
+	preallocate=True reserves the final size of the dump with posix_fallocate once the layout is known,
+	plan() returns that size without fetching memory
+
+	instrumentation (a minidump_instrumentation.write_instrumentation) records stream, read and write timings
+	and reports the progress of the memory payload
+
+	journal (a path) records the parts of the memory payload that reached the file. after a failed write,
+	resume=True with the same journal and the partial dump opened "r+b" checks the header, directory and memory
+	list against the file and only fetches the missing ranges. needs a seekable file without compression or
+	baseline, see minidump_journal
+
+	io_scheduler is shared by writers running at the same time (see minidump_batch.shared_io_scheduler):
+	acquire(amount) / release(amount) bracket every chunk from its read to its write, reserve_write(size)
+	is called before every payload write and may block to pace the writers
+
+	throttle (a minidump_throttle.read_throttle) rate limits the provider reads of the memory payload and
+	pauses between chunks to bound the impact of the dump on the dumped process
+
+	probe_memory=True reads the memory descriptors once before the layout and drops the pages that can't be read
+	(guard pages, decommitted holes) from the Memory64ListStream instead of zero filling them. providers can
+	answer the probe cheaply with probe_readable. plan() doesn't probe, the dump can end up smaller than planned
+
+	mmap_output=True preallocates the dump once the layout is known and maps it, get_bytes_into then fills
+	the payload in place and get_bytes results are copied into the map without a write call. needs a regular
+	file without sparse output, compression or baseline
+	"""
+	def __init__(self, file, chunk_size="auto", fetch_threads=0, max_in_flight=0x4000000, sparse=False, baseline=None, compression=None, compression_threads=None,
+			preset=None, memory_filters=(), thread_stacks=False, instrumentation=None, preallocate=False, journal=None, resume=False,
+			io_scheduler=None, throttle=None, mmap_output=False, probe_memory=False):
+		self._output_file = file
 		self._file = file
+		self._file_write = getattr(file, "write", None)
+		if self._file_write is None:
+			self._file_write = file.sendall
 
 		self.bitness = 32
 		self.whole_range_size = False
@@ -115,6 +470,90 @@ class minidump_writer:
 		if self.chunk_size == -1:
 			self.whole_range_size = True
 
+		# tuned while the payload is fetched, see _chunk_size_tuner
+		self.adaptive_chunk_size = self.chunk_size == "auto"
+		if self.adaptive_chunk_size:
+			self.chunk_size = 0x10000
+
+		self._chunk_size_tuner = None
+
+		# unreadable pages zero filled in the dump, see unreadable_memory_error
+		self.unreadable_bytes = 0
+		self._unreadable_lock = threading.Lock()
+
+		self.fetch_threads = fetch_threads
+		self.max_in_flight = max_in_flight
+		# set while the parallel fetcher runs, _write_at then uses positional writes
+		self._fd = None
+
+		self.sparse = sparse
+		self.sparse_bytes_skipped = 0
+		self._sparse_lock = threading.Lock()
+
+		self.baseline = baseline
+		self.delta_encoder = None
+
+		self.compression = compression
+		self.compression_threads = compression_threads
+		self.compressor = None
+
+		self.preset = preset
+		if isinstance(self.preset, str):
+			self.preset = dump_presets[self.preset]
+
+		self.memory_filters = list(memory_filters)
+
+		# whatever take_snapshot returned, only set while write() runs
+		self.snapshot = None
+
+		self.instrumentation = instrumentation
+		self.preallocate = preallocate
+
+		self.journal = journal
+		self.resume = resume
+		if self.resume and self.journal is None:
+			raise ValueError("Resuming a dump needs the journal of the failed write")
+
+		if self.journal is not None and (self.compression is not None or self.baseline is not None):
+			raise ValueError("A journal needs the dump written to the file directly, not compressed or as a delta")
+
+		self._journal = None
+		# set when the metadata was validated against the file of the previous run
+		self._resuming = False
+
+		self.io_scheduler = io_scheduler
+		self.throttle = throttle
+
+		self.probe_memory = probe_memory
+		# unreadable bytes left out of the dump by probe_memory
+		self.probed_out_bytes = 0
+
+		self.mmap_output = mmap_output
+		# the mapped dump while the payload is fetched
+		self._output_map = None
+		self._output_map_view = None
+
+		self.thread_stacks = thread_stacks
+		# thread id -> (stack start, stack size, stack bytes), read before the streams are laid out
+		self._thread_stacks = {}
+		self._stack_memory_descriptors = []
+
+		# cleared the first time the provider's get_bytes_into returns None
+		self._get_bytes_into_supported = True
+		self._buffer_pool = None
+
+		# cleared when the output or the platform can't do kernel side copies of file backed ranges
+		self._kernel_copy_supported = True
+		self._use_copy_file_range = True
+
+		# every stream except the memory payload is laid out here before anything reaches self._file
+		self._layout = None
+		self._end_rva = 0
+		self._file_offset = 0
+		self._memory64_list_struct = None
+		self._memory64_payload_size = 0
+		self._stream_sizes = OrderedDict()
+
 		# translators translate results to the MINIDUMP format struct
 		self.stream_to_handler = OrderedDict()
 		self.stream_to_handler[MINIDUMP_STREAM_TYPE.SystemInfoStream.value] = (self.get_system_info, self.get_system_info_translator, None)
@@ -122,17 +561,21 @@ class minidump_writer:
 		self.stream_to_handler[MINIDUMP_STREAM_TYPE.ThreadListStream.value] = (self.get_threads, self.get_threads_translator, None)
 		self.stream_to_handler[MINIDUMP_STREAM_TYPE.MemoryInfoListStream.value] = (self.get_memory_info, self.get_memory_info_translator, None)
 
+		if self.thread_stacks:
+			# after ThreadListStream, its translator copies the stacks this stream lists
+			self.stream_to_handler[MINIDUMP_STREAM_TYPE.MemoryListStream.value] = (self.get_thread_stacks, self.get_memory_list_translator, None)
+
 		# Put this last for clarity
 		self.stream_to_handler[MINIDUMP_STREAM_TYPE.Memory64ListStream.value] = (self.get_memory_descriptors, self.get_memory_descriptors_translator, self.memory_fetcher)
 		
 
 	def get_system_info_translator(self, system_info):
 		allocated_system_info_rva = self._alloc(MINIDUMP_SYSTEM_INFO.size())
-		system_info_struct = MINIDUMP_SYSTEM_INFO(allocated_system_info_rva, self._file)
+		system_info_struct = MINIDUMP_SYSTEM_INFO(allocated_system_info_rva, self._layout)
 		system_info_struct.ProcessorArchitecture = arch_to_ProcessorArchitecture.get(system_info["ProcessorArchitecture"], ProcessorArchitecture.PROCESSOR_ARCHITECTURE_UNKNOWN.value)
 
 		self.arch = system_info_struct.ProcessorArchitecture
-		if system_info_struct.ProcessorArchitecture in [ProcessorArchitecture.PROCESSOR_ARCHITECTURE_AMD64.value, ProcessorArchitecture.PROCESSOR_ARCHITECTURE_IA64.value]:
+		if system_info_struct.ProcessorArchitecture in [ProcessorArchitecture.PROCESSOR_ARCHITECTURE_AMD64.value, ProcessorArchitecture.PROCESSOR_ARCHITECTURE_IA64.value, ProcessorArchitecture.PROCESSOR_ARCHITECTURE_ARM64.value]:
 			self.bitness = 64
 
 		system_info_struct.ProcessorLevel = system_info.get("ProcessorLevel", ProcessorLevel.INTEL_PRO_OR_PENTIUM_2.value)
@@ -153,39 +596,44 @@ class minidump_writer:
 		return location
 
 	def get_memory_info_translator(self, memory_info):
-		size_needed_for_info = MINIDUMP_MEMORY_INFO_LIST.size() + len(memory_info) * MINIDUMP_MEMORY_INFO.size()
+		number_of_entries = table_length(memory_info)
+		size_needed_for_info = MINIDUMP_MEMORY_INFO_LIST.size() + number_of_entries * MINIDUMP_MEMORY_INFO.size()
 		memory_info_list_location = self._alloc(size_needed_for_info)
 
-		memory_info_list_struct = MINIDUMP_MEMORY_INFO_LIST(memory_info_list_location, self._file)
+		memory_info_list_struct = MINIDUMP_MEMORY_INFO_LIST(memory_info_list_location, self._layout)
 		memory_info_list_struct.SizeOfHeader = memory_info_list_struct.size()
 		memory_info_list_struct.SizeOfEntry = MINIDUMP_MEMORY_INFO.size()
-		memory_info_list_struct.NumberOfEntries = len(memory_info)
+		memory_info_list_struct.NumberOfEntries = number_of_entries
 		memory_info_list_struct.write()
 
-		for memory_info_index, current_memory_info in enumerate(memory_info):
-			memory_info_location = memory_info_list_location + MINIDUMP_MEMORY_INFO_LIST.size() + (memory_info_index * MINIDUMP_MEMORY_INFO.size())
-			memory_info_struct = MINIDUMP_MEMORY_INFO(memory_info_location, self._file)
-
-			memory_info_struct.BaseAddress = current_memory_info.get("BaseAddress", 0)
-			memory_info_struct.AllocationBase = current_memory_info.get("AllocationBase", 0)
-			if memory_info_struct.AllocationBase == 0:
-				memory_info_struct.AllocationBase = memory_info_struct.BaseAddress
-
-			if type(current_memory_info["AllocationProtect"]) == str:
-				memory_info_struct.AllocationProtect = string_protect_to_MemoryProtection[current_memory_info.get("AllocationProtect", "rwx")]
-			else:
-				memory_info_struct.AllocationProtect = current_memory_info["AllocationProtect"]
+		if is_columnar(memory_info):
+			self._layout.seek(memory_info_list_location + MINIDUMP_MEMORY_INFO_LIST.size())
+			self._layout.write(memory_info_table(memory_info))
+		else:
+			for memory_info_index, current_memory_info in enumerate(memory_info):
+				memory_info_location = memory_info_list_location + MINIDUMP_MEMORY_INFO_LIST.size() + (memory_info_index * MINIDUMP_MEMORY_INFO.size())
+				memory_info_struct = MINIDUMP_MEMORY_INFO(memory_info_location, self._layout)
+
+				memory_info_struct.BaseAddress = current_memory_info.get("BaseAddress", 0)
+				memory_info_struct.AllocationBase = current_memory_info.get("AllocationBase", 0)
+				if memory_info_struct.AllocationBase == 0:
+					memory_info_struct.AllocationBase = memory_info_struct.BaseAddress
+
+				if type(current_memory_info["AllocationProtect"]) == str:
+					memory_info_struct.AllocationProtect = string_protect_to_MemoryProtection[current_memory_info.get("AllocationProtect", "rwx")]
+				else:
+					memory_info_struct.AllocationProtect = current_memory_info["AllocationProtect"]
 				
-			if type(current_memory_info["Protect"]) == str:
-				memory_info_struct.Protect = string_protect_to_MemoryProtection[current_memory_info.get("Protect", "rwx")]
-			else:
-				memory_info_struct.Protect = current_memory_info["Protect"]
+				if type(current_memory_info["Protect"]) == str:
+					memory_info_struct.Protect = string_protect_to_MemoryProtection[current_memory_info.get("Protect", "rwx")]
+				else:
+					memory_info_struct.Protect = current_memory_info["Protect"]
 
-			memory_info_struct.RegionSize = current_memory_info.get("RegionSize", 0)
-			memory_info_struct.State = 0x1000 # MEM_COMMIT
-			memory_info_struct.Type = string_type_to_MemoryType[current_memory_info.get("Type", "Private")]
+				memory_info_struct.RegionSize = current_memory_info.get("RegionSize", 0)
+				memory_info_struct.State = 0x1000 # MEM_COMMIT
+				memory_info_struct.Type = string_type_to_MemoryType[current_memory_info.get("Type", "Private")]
 
-			memory_info_struct.write()
+				memory_info_struct.write()
 
 		location = MINIDUMP_LOCATION_DESCRIPTOR()
 		location.DataSize = size_needed_for_info
@@ -198,13 +646,13 @@ class minidump_writer:
 		size_needed_for_info = MINIDUMP_THREAD_LIST.size() + (MINIDUMP_THREAD.size() * len(threads.keys()))
 		thread_info_location = self._alloc(size_needed_for_info)
 		
-		thread_list_struct = MINIDUMP_THREAD_LIST(thread_info_location, self._file)
+		thread_list_struct = MINIDUMP_THREAD_LIST(thread_info_location, self._layout)
 		thread_list_struct.NumberOfThreads = len(threads.keys())
 		thread_list_struct.write()
 
 		for thread_index, thread_id in enumerate(threads):
 			thread_struct_location = thread_info_location + MINIDUMP_THREAD_LIST.size() + (thread_index * MINIDUMP_THREAD.size())
-			thread_struct = MINIDUMP_THREAD(thread_struct_location, self._file)
+			thread_struct = MINIDUMP_THREAD(thread_struct_location, self._layout)
 			thread_info = threads[thread_id]
 
 			thread_struct.ThreadId = thread_id
@@ -213,13 +661,23 @@ class minidump_writer:
 			thread_struct.Teb = thread_info.get("Teb", 0)
 
 			thread_context = thread_info.get("Context", {})
-			thread_context_struct = _context_from_provider_context(thread_context, self.arch)
-			if thread_context_struct is not None:
-				context_bytes = bytes(thread_context_struct)
+			context_bytes = _context_from_provider_context(thread_context, self.arch)
+			if context_bytes is not None:
 				context_location_rva = self._alloc_buffer(context_bytes)
 				thread_struct.ThreadContext.Rva = context_location_rva
 				thread_struct.ThreadContext.DataSize = len(context_bytes)
 
+			if thread_id in self._thread_stacks:
+				stack_start, stack_size, stack_data = self._thread_stacks[thread_id]
+				stack_struct = MINIDUMP_MEMORY_DESCRIPTOR()
+				stack_struct.StartOfMemoryRange = stack_start
+				# plan() sizes the stacks without reading them
+				stack_struct.Memory.Rva = self._alloc_buffer(stack_data) if stack_data is not None else self._alloc(stack_size)
+				stack_struct.Memory.DataSize = stack_size
+
+				thread_struct.Stack = stack_struct
+				self._stack_memory_descriptors.append(stack_struct)
+
 			thread_struct.write()
 
 		location = MINIDUMP_LOCATION_DESCRIPTOR()
@@ -228,17 +686,54 @@ class minidump_writer:
 
 		return location
 
+	def get_thread_stacks(self):
+		"""
+		the stacks are read once every stream was gathered, see _resolve_thread_stacks
+		"""
+		return None
+
+	def get_memory_list_translator(self, _):
+		size_needed_for_info = MINIDUMP_MEMORY_LIST.size() + MINIDUMP_MEMORY_DESCRIPTOR.size() * len(self._stack_memory_descriptors)
+		memory_list_location = self._alloc(size_needed_for_info)
+
+		memory_list_struct = MINIDUMP_MEMORY_LIST(memory_list_location, self._layout)
+		memory_list_struct.NumberOfMemoryRanges = len(self._stack_memory_descriptors)
+		memory_list_struct.write()
+
+		self._layout.seek(memory_list_location + MINIDUMP_MEMORY_LIST.size())
+		for stack_struct in self._stack_memory_descriptors:
+			self._layout.write(bytes(stack_struct))
+
+		location = MINIDUMP_LOCATION_DESCRIPTOR()
+		location.DataSize = size_needed_for_info
+		location.Rva = memory_list_location
+
+		return location
+
+	def _get_bytes_exact(self, address, size, info, salvage=True):
+		try:
+			buffer = self.get_bytes(address, size, info)
+			while len(buffer) < size:
+				buffer = bytes(buffer) + self.get_bytes(address + len(buffer), size - len(buffer), info)
+		except unreadable_memory_error:
+			if not salvage:
+				raise
+
+			return self._salvage_chunk(address, size, info)
+
+		return buffer
+
 	def get_modules_translator(self, modules):
 		amount_of_modules = len(modules)
 		size_needed_for_info = MINIDUMP_MODULE_LIST.size() + (MINIDUMP_MODULE.size() * amount_of_modules)
 		minidump_module_list_location = self._alloc(size_needed_for_info)
-		module_list_struct = MINIDUMP_MODULE_LIST(minidump_module_list_location, self._file)
+		module_list_struct = MINIDUMP_MODULE_LIST(minidump_module_list_location, self._layout)
 		module_list_struct.NumberOfModules = amount_of_modules
 		module_list_struct.write()
 
 		for module_index, module in enumerate(modules):
 			module_struct_location = minidump_module_list_location + MINIDUMP_MODULE_LIST.size() + (module_index * MINIDUMP_MODULE.size())
-			module_struct = MINIDUMP_MODULE(module_struct_location, self._file)
+			module_struct = MINIDUMP_MODULE(module_struct_location, self._layout)
 
 			module_struct.BaseOfImage = module["BaseOfImage"]
 			module_struct.SizeOfImage = module["SizeOfImage"]
@@ -255,30 +750,35 @@ class minidump_writer:
 		return location
 
 	def get_memory_descriptors_translator(self, memory_descriptors):
-		number_of_ranges = len(memory_descriptors)
+		number_of_ranges = table_length(memory_descriptors)
 
 		size_needed_for_info = MINIDUMP_MEMORY64_LIST.size() + (number_of_ranges * MINIDUMP_MEMORY_DESCRIPTOR64.size())
 		memory_list_location = self._alloc(size_needed_for_info)
-		memory64_list_struct = MINIDUMP_MEMORY64_LIST(memory_list_location, self._file)
+		memory64_list_struct = MINIDUMP_MEMORY64_LIST(memory_list_location, self._layout)
 		memory64_list_struct.NumberOfMemoryRanges = number_of_ranges
 
 		total_size_for_memory = 0
 
-		for range_index, descriptor in enumerate(memory_descriptors):
-			descriptor_location = memory_list_location + MINIDUMP_MEMORY64_LIST.size() + (range_index * MINIDUMP_MEMORY_DESCRIPTOR64.size())
-			descriptor_struct = MINIDUMP_MEMORY_DESCRIPTOR64(descriptor_location, self._file)
+		if is_columnar(memory_descriptors):
+			descriptors_buffer, total_size_for_memory = memory_descriptor_table(memory_descriptors)
+			self._layout.seek(memory_list_location + MINIDUMP_MEMORY64_LIST.size())
+			self._layout.write(descriptors_buffer)
+		else:
+			for range_index, descriptor in enumerate(memory_descriptors):
+				descriptor_location = memory_list_location + MINIDUMP_MEMORY64_LIST.size() + (range_index * MINIDUMP_MEMORY_DESCRIPTOR64.size())
+				descriptor_struct = MINIDUMP_MEMORY_DESCRIPTOR64(descriptor_location, self._layout)
 
-			range_start, range_size, _ = descriptor
-			total_size_for_memory += range_size
+				range_start, range_size, _ = descriptor
+				total_size_for_memory += range_size
 
-			descriptor_struct.StartOfMemoryRange = range_start
-			descriptor_struct.DataSize = range_size
+				descriptor_struct.StartOfMemoryRange = range_start
+				descriptor_struct.DataSize = range_size
 
-			descriptor_struct.write()
+				descriptor_struct.write()
 
-
-		memory64_list_struct.BaseRva = self._alloc(total_size_for_memory)
-		memory64_list_struct.write()
+		# BaseRva is assigned once every other stream is laid out, see write_directories
+		self._memory64_list_struct = memory64_list_struct
+		self._memory64_payload_size = total_size_for_memory
 
 		location = MINIDUMP_LOCATION_DESCRIPTOR()
 		location.DataSize = size_needed_for_info
@@ -287,46 +787,512 @@ class minidump_writer:
 		return location
 
 	def memory_fetcher(self, memory_descriptors, directory):
-		memory64_list_struct = MINIDUMP_MEMORY64_LIST(directory.Location.Rva, self._file, True)
-		current_disk_rva = memory64_list_struct.BaseRva
-		for range_start, range_size, info in memory_descriptors:
-			self._get_bytes_wrapper(range_start, range_size, info, current_disk_rva)
+		current_disk_rva = self._memory64_list_struct.BaseRva
+		if self.fetch_threads > 1:
+			if not hasattr(os, "pwrite"):
+				logging.warning("os.pwrite is not available, fetching memory sequentially")
+			elif not hasattr(self._file, "fileno") or not self._output_seekable(self._file):
+				# pipes and sockets have a fileno() as well, pwrite fails on them with ESPIPE
+				logging.warning("Parallel fetching needs a seekable file with fileno(), fetching memory sequentially")
+			else:
+				self._parallel_memory_fetcher(memory_descriptors, current_disk_rva)
+				return
+
+		for range_start, range_size, info, disk_rva in self._payload_ranges(memory_descriptors, current_disk_rva):
+			self._get_bytes_wrapper(range_start, range_size, info, disk_rva)
+
+	def _payload_ranges(self, memory_descriptors, current_disk_rva):
+		"""
+		yields (range_start, range_size, info, disk_rva) of every range to fetch, when resuming only the
+		parts the previous run did not write
+		"""
+		for range_start, range_size, info in iter_fetch_ranges(memory_descriptors):
+			if not self._resuming:
+				yield range_start, range_size, info, current_disk_rva
+			else:
+				for missing_rva, missing_size in self._journal.missing(current_disk_rva, range_size):
+					yield range_start + missing_rva - current_disk_rva, missing_size, info, missing_rva
+
 			current_disk_rva += range_size
-			
+
+	def _parallel_memory_fetcher(self, memory_descriptors, current_disk_rva):
+		self._file.flush()
+		self._fd = self._file.fileno()
+		limiter = _in_flight_limiter(self.max_in_flight)
+		# the first error of a fetch thread, checked on every submit without walking the chunks in flight
+		errors = []
+
+		def fetch_batch(chunks, batch_size):
+			try:
+				for chunk_start, chunk_size, info, disk_rva in chunks:
+					self._get_bytes_wrapper(chunk_start, chunk_size, info, disk_rva)
+			except BaseException as e:
+				errors.append(e)
+			finally:
+				limiter.release(batch_size)
+
+		try:
+			with ThreadPoolExecutor(max_workers=self.fetch_threads) as executor:
+				try:
+					batch = []
+					batch_size = 0
+					for range_start, range_size, info, disk_rva in self._payload_ranges(memory_descriptors, current_disk_rva):
+						range_offset = 0
+						while range_offset < range_size:
+							amount_bytes_to_read = self._next_chunk_size(range_size - range_offset)
+							batch.append((range_start + range_offset, amount_bytes_to_read, info, disk_rva + range_offset))
+							batch_size += amount_bytes_to_read
+							range_offset += amount_bytes_to_read
+							if batch_size < PARALLEL_BATCH_SIZE:
+								continue
+
+							# surface provider errors early instead of after the whole dump was fetched
+							if errors:
+								raise errors[0]
+
+							limiter.acquire(batch_size)
+							executor.submit(fetch_batch, batch, batch_size)
+							batch = []
+							batch_size = 0
+
+					if batch:
+						limiter.acquire(batch_size)
+						executor.submit(fetch_batch, batch, batch_size)
+				except BaseException:
+					# the batches not started yet are dropped, the running ones finish before the pool exits
+					executor.shutdown(wait=True, cancel_futures=True)
+					raise
+
+			if errors:
+				raise errors[0]
+		finally:
+			self._fd = None
+
+		self._file_offset = current_disk_rva + self._memory64_payload_size
+
 	def _get_bytes_wrapper(self, range_start, range_size, info, disk_rva):
+		if self._kernel_copy_supported:
+			file_backing = self.get_file_backing(range_start, range_size, info)
+			if file_backing is not None:
+				if self.instrumentation is not None:
+					copy_start = time.perf_counter()
+
+				if self._copy_file_backing(disk_rva, file_backing, range_size):
+					if self.instrumentation is not None:
+						# the kernel reads and writes at once, the copy counts as a write
+						self.instrumentation.record_write(time.perf_counter() - copy_start, range_size)
+
+					if self._journal is not None:
+						self._journal.record(disk_rva, range_size)
+					return
+
 		bytes_written = 0
 		while bytes_written < range_size:
-			chunk_size = self.chunk_size
-			if self.whole_range_size:
-				chunk_size = range_size
+			amount_bytes_to_read = self._next_chunk_size(range_size - bytes_written)
+			if self.throttle is not None:
+				# before the scheduler, the budget of the other writers isn't held while waiting
+				self.throttle.wait(amount_bytes_to_read)
+
+			if self.io_scheduler is not None:
+				self.io_scheduler.acquire(amount_bytes_to_read)
 
-			amount_bytes_to_read = min(chunk_size, range_size - bytes_written)
-			buffer = self.get_bytes(range_start + bytes_written, amount_bytes_to_read, info)
+			try:
+				amount_read = self._read_and_write_chunk(range_start + bytes_written, amount_bytes_to_read, info, disk_rva)
+			finally:
+				if self.io_scheduler is not None:
+					self.io_scheduler.release(amount_bytes_to_read)
 
-			self._file.seek(disk_rva)
-			self._file.write(buffer)
+			disk_rva += amount_read
+			bytes_written += amount_read
 
-			disk_rva += len(buffer)
-			bytes_written += len(buffer)
+			if self.throttle is not None:
+				self.throttle.pause()
 
 		assert bytes_written == range_size
 
+	def _next_chunk_size(self, remaining_size):
+		if self.whole_range_size:
+			return remaining_size
+
+		if self._chunk_size_tuner is not None:
+			return min(self._chunk_size_tuner.size, remaining_size)
+
+		return min(self.chunk_size, remaining_size)
+
+	def _salvage_split(self, address, size):
+		"""
+		page aligned address splitting a range that failed to read in about half, None for a single page
+		"""
+		split_address = (address + size // 2) // SPARSE_PAGE_SIZE * SPARSE_PAGE_SIZE
+		if split_address <= address:
+			split_address = (address // SPARSE_PAGE_SIZE + 1) * SPARSE_PAGE_SIZE
+
+		if split_address >= address + size:
+			return None
+
+		return split_address
+
+	def _unreadable(self, size):
+		with self._unreadable_lock:
+			self.unreadable_bytes += size
+
+	def _salvage_chunk(self, address, size, info):
+		"""
+		reads a chunk that raised unreadable_memory_error in halves down to pages, returns it with the
+		pages that still fail zero filled
+		"""
+		buffer = self._begin_salvage(size)
+		for part_address, part_size, data in self._read_salvaging(address, size, info):
+			self._salvaged_part(buffer, address, part_address, part_size, data)
+
+		return buffer
+
+	def _begin_salvage(self, size):
+		if self._chunk_size_tuner is not None:
+			self._chunk_size_tuner.fault()
+
+		return bytearray(size)
+
+	def _salvaged_part(self, buffer, address, part_address, part_size, data):
+		# the pages that still fail stay zero filled
+		if data is None:
+			self._unreadable(part_size)
+		else:
+			buffer[part_address - address:part_address - address + part_size] = data
+
+	def _read_salvaging(self, address, size, info):
+		"""
+		yields (part_address, part_size, bytes) covering the range in address order, bytes is None for the
+		pages that can't be read. parts that fail are read again in halves down to pages
+		"""
+		# ranges left to read, the lowest on top
+		pending = [(address, size)]
+		while pending:
+			part_address, part_size = pending.pop()
+			try:
+				data = self._get_bytes_exact(part_address, part_size, info, salvage=False)
+			except unreadable_memory_error:
+				if not self._split_failed_part(pending, part_address, part_size):
+					yield part_address, part_size, None
+
+				continue
+
+			yield part_address, part_size, data
+
+	def _split_failed_part(self, pending, part_address, part_size):
+		"""
+		puts the halves of a part that failed to read on top of pending, returns False for a single page
+		"""
+		split_address = self._salvage_split(part_address, part_size)
+		if split_address is None:
+			return False
+
+		pending.append((split_address, part_address + part_size - split_address))
+		pending.append((part_address, split_address - part_address))
+		return True
+
+	def _read_and_write_chunk(self, address, amount_bytes_to_read, info, disk_rva):
+		"""
+		reads one chunk and writes it at disk_rva, returns the amount read (providers may return less than asked for)
+		"""
+		if self._output_map_view is not None and self._get_bytes_into_supported:
+			amount_filled = self._read_into_map(address, amount_bytes_to_read, info, disk_rva)
+			if amount_filled is not None:
+				return amount_filled
+
+		timed = self.instrumentation is not None or self.throttle is not None or self._chunk_size_tuner is not None
+		if timed:
+			read_start = time.perf_counter()
+
+		pooled_buffer = None
+		salvaged = False
+		try:
+			if self._get_bytes_into_supported:
+				pooled_buffer = self._buffer_pool.acquire(amount_bytes_to_read)
+				buffer = memoryview(pooled_buffer)[:amount_bytes_to_read]
+				amount_filled = self.get_bytes_into(address, buffer, info)
+				if amount_filled is None:
+					self._get_bytes_into_supported = False
+					self._buffer_pool.release(pooled_buffer)
+					pooled_buffer = None
+				else:
+					buffer = buffer[:amount_filled]
+
+			if pooled_buffer is None:
+				buffer = self.get_bytes(address, amount_bytes_to_read, info)
+		except unreadable_memory_error:
+			if pooled_buffer is not None:
+				self._buffer_pool.release(pooled_buffer)
+				pooled_buffer = None
+
+			buffer = self._salvage_chunk(address, amount_bytes_to_read, info)
+			salvaged = True
+
+		if timed:
+			self._record_read(time.perf_counter() - read_start, len(buffer), salvaged)
+
+		try:
+			self._write_at(disk_rva, buffer)
+		finally:
+			if pooled_buffer is not None:
+				self._buffer_pool.release(pooled_buffer)
+
+		return len(buffer)
+
+	def _record_read(self, read_seconds, size, salvaged):
+		if self.instrumentation is not None:
+			self.instrumentation.record_read(read_seconds, size)
+
+		if self.throttle is not None:
+			self.throttle.record_read(read_seconds, size)
+
+		# a salvaged chunk was read many times, its time says nothing about the chunk size
+		if self._chunk_size_tuner is not None and not salvaged:
+			self._chunk_size_tuner.record(size, read_seconds)
+
+	def _read_into_map(self, address, amount_bytes_to_read, info, disk_rva):
+		"""
+		lets the provider fill the destination of the chunk in the mapped dump, returns None when
+		get_bytes_into isn't supported
+		"""
+		if self.io_scheduler is not None:
+			self.io_scheduler.reserve_write(amount_bytes_to_read)
+
+		read_start = time.perf_counter()
+		salvaged = False
+		with self._output_map_view[disk_rva:disk_rva + amount_bytes_to_read] as destination:
+			try:
+				amount_filled = self.get_bytes_into(address, destination, info)
+			except unreadable_memory_error:
+				destination[:] = self._salvage_chunk(address, amount_bytes_to_read, info)
+				amount_filled = amount_bytes_to_read
+				salvaged = True
+
+		if amount_filled is None:
+			self._get_bytes_into_supported = False
+			return None
+
+		self._record_read(time.perf_counter() - read_start, amount_filled, salvaged)
+		if self.instrumentation is not None:
+			# the provider wrote into the page cache, nothing is left to write
+			self.instrumentation.record_write(0.0, amount_filled)
+
+		if self._journal is not None:
+			self._journal.record(disk_rva, amount_filled)
+
+		return amount_filled
+
+	def plan(self):
+		"""
+		dry run of write(): every stream is gathered and translated but no memory is fetched and nothing
+		reaches the file. returns {"size": final size of the dump, "streams": {stream name: bytes}}, the
+		Memory64ListStream entry includes its payload and "headers" the header and the directory.
+		delta and compressed output end up smaller than size
+		"""
+		self._begin_plan()
+		self.snapshot = self.take_snapshot()
+		try:
+			self.write_header()
+			self.write_directories_header()
+			headers_size = self._end_rva
+
+			stream_infos = [self._instrumented(directory.StreamType, "enumerate", self.stream_to_handler[directory.StreamType][0]) for directory in self.directories]
+			self._plan_streams(stream_infos)
+		finally:
+			self.snapshot = None
+
+		return self._plan_result(headers_size)
+
+	def _begin_plan(self):
+		self._reset_layout()
+		self._sparse = self.sparse and self.compression is None and self.baseline is None and self._output_seekable(self._output_file)
+
+	def _plan_streams(self, stream_infos):
+		if self.thread_stacks:
+			for thread_id, stack_start, stack_size, info in self._resolve_thread_stacks(stream_infos):
+				self._thread_stacks[thread_id] = (stack_start, stack_size, None)
+
+		self._select_memory(stream_infos)
+		self._translate_streams(stream_infos)
+
+	def _plan_result(self, headers_size):
+		streams = OrderedDict()
+		streams["headers"] = headers_size
+		for stream_type, stream_size in self._stream_sizes.items():
+			try:
+				stream_name = MINIDUMP_STREAM_TYPE(stream_type).name
+			except ValueError:
+				stream_name = str(stream_type)
+
+			streams[stream_name] = stream_size
+
+		if MINIDUMP_STREAM_TYPE.Memory64ListStream.value in self._stream_sizes:
+			streams[MINIDUMP_STREAM_TYPE.Memory64ListStream.name] += self._memory64_payload_size
+
+		# sparse output page aligns the payload
+		padding = self._end_rva - sum(streams.values())
+		if padding:
+			streams["padding"] = padding
+
+		return {"size": self._end_rva, "streams": streams}
+
 	def write(self):
-		self.write_header()
-		self.write_directories_header()
-		self.write_directories()
+		"""
+		the dump is written in two phases. first every provider result is gathered and every stream is laid out
+		in memory, which assigns all RVAs. then the file is emitted strictly front to back:
+		header, directory, streams and last the Memory64 payload
+		"""
+		self._begin_write()
+		self.snapshot = self.take_snapshot()
+		try:
+			self.write_header()
+			self.write_directories_header()
+			self.write_directories()
+			self._finish_write()
+		finally:
+			self.snapshot = None
+			self._close_journal()
+			self._unmap_output()
+			self._abort_encoders()
+
+	def _reset_layout(self):
+		self._layout = io.BytesIO()
+		self._end_rva = 0
+		self._file_offset = 0
+		self._memory64_list_struct = None
+		self._memory64_payload_size = 0
+		self._thread_stacks = {}
+		self._stack_memory_descriptors = []
+		self._stream_sizes = OrderedDict()
+
+	def _output_seekable(self, output):
+		return hasattr(output, "seekable") and output.seekable()
+
+	def _begin_write(self):
+		self._reset_layout()
+
+		self._chunk_size_tuner = None
+		if self.adaptive_chunk_size:
+			self._chunk_size_tuner = _chunk_size_tuner(self.chunk_size)
+
+		self.unreadable_bytes = 0
+
+		# one buffer per worker and one more so a worker never waits for a buffer that is being written
+		buffer_size = max(self.chunk_size, 0)
+		self._get_bytes_into_supported = True
+		self._kernel_copy_supported = True
+		self._use_copy_file_range = True
+		self._buffer_pool = _buffer_pool(buffer_size, max(self.fetch_threads, 1) + 1)
+
+		# the encoders take the place of the file, they only have write() so everything stays sequential
+		output = self._output_file
+		self.compressor = None
+		if self.compression is not None:
+			self.compressor = block_compressor(output, self.compression, threads=self.compression_threads)
+			output = self.compressor
+
+		self.delta_encoder = None
+		if self.baseline is not None:
+			try:
+				self.delta_encoder = minidump_delta_encoder(self.baseline, output)
+			except BaseException:
+				self._abort_encoders()
+				raise
+
+			output = self.delta_encoder
+
+		self._file = output
+		self._file_write = getattr(output, "write", None)
+		if self._file_write is None:
+			self._file_write = output.sendall
+
+		self.sparse_bytes_skipped = 0
+		self._sparse = self.sparse
+		if self._sparse and not self._output_seekable(self._file):
+			logging.warning("Sparse output needs a seekable file, zero pages will be written")
+			self._sparse = False
+
+		self._output_map = None
+		self._output_map_view = None
+		self._mmap_output = self.mmap_output
+		if self._mmap_output and (self._sparse or self._file is not self._output_file):
+			logging.warning("Memory mapped output needs a plain file without sparse output, compression or baseline, writing the payload instead")
+			self._mmap_output = False
+
+		self._journal = None
+		self._resuming = False
+		if self.journal is not None:
+			self._journal = minidump_journal(self.journal)
+			if self.resume:
+				# raises when the previous run did not get as far as the payload
+				self._journal.load()
+
+	def _finish_write(self):
+		self._unmap_output()
+
+		if self.delta_encoder is not None:
+			self.delta_encoder.close()
+			logging.info(f"Delta stored {self.delta_encoder.literal_bytes:#x} bytes, {self.delta_encoder.baseline_bytes:#x} bytes taken from the baseline")
+
+		if self.compressor is not None:
+			self.compressor.close()
+
+		flush = getattr(self._file, "flush", None)
+		if flush is not None:
+			flush()
+
+		if self._sparse:
+			logging.info(f"Sparse output skipped {self.sparse_bytes_skipped:#x} zero bytes")
+
+		if self.unreadable_bytes:
+			logging.info(f"{self.unreadable_bytes:#x} unreadable bytes were zero filled")
+
+		if self._journal is not None:
+			self._journal.complete()
+			self._journal = None
+
+	def _abort_encoders(self):
+		# a failed write leaves the compression threads and the baseline open, a finished one closed them already
+		if self.delta_encoder is not None:
+			self.delta_encoder.abort()
+
+		if self.compressor is not None:
+			self.compressor.abort()
+
+	def _close_journal(self):
+		# after a failure, what was written is recorded so the write can be resumed
+		if self._journal is not None:
+			self._journal.close()
+			self._journal = None
+
+	def _sync_output(self):
+		if self._output_map is not None:
+			self._output_map.flush()
+
+		if self._fd is not None:
+			os.fsync(self._fd)
+			return
+
+		self._file.flush()
+		os.fsync(self._file.fileno())
 
 	def write_header(self):
-		self.header = MINIDUMP_HEADER(0, self._file)
+		self.header = MINIDUMP_HEADER(self._alloc(MINIDUMP_HEADER.size()), self._layout)
 		self.header.Signature = 0x504D444D # 'MDMP'
 		self.header.Version = 0xA0BAA793
 		self.header.NumberOfStreams = len(self.stream_to_handler)
 		self.header.TimeDateStamp = int(time.time())
+		if self._journal is not None and self.resume:
+			# the header has to match the one written by the failed run
+			self.header.TimeDateStamp = self._journal.time_date_stamp
 		self.header.StreamDirectoryRva = self.header.size()
 
 		if MINIDUMP_STREAM_TYPE.Memory64ListStream.value in self.stream_to_handler:
-			self.header.Flags |= MINIDUMP_TYPE.MiniDumpWithFullMemory
-			self.header.Flags |= MINIDUMP_TYPE.MiniDumpIgnoreInaccessibleMemory
+			if self.preset is not None:
+				self.header.Flags |= self.preset.flags
+			else:
+				self.header.Flags |= MINIDUMP_TYPE.MiniDumpWithFullMemory
+				self.header.Flags |= MINIDUMP_TYPE.MiniDumpIgnoreInaccessibleMemory
 
 		if MINIDUMP_STREAM_TYPE.MemoryInfoListStream.value in self.stream_to_handler:
 			self.header.Flags |= MINIDUMP_TYPE.MiniDumpWithFullMemoryInfo
@@ -334,27 +1300,27 @@ class minidump_writer:
 		self.header.write()
 
 	def write_directories_header(self):
-		current_file_offset = self.header.StreamDirectoryRva
-		self._file.seek(current_file_offset)
+		current_file_offset = self._alloc(MINIDUMP_DIRECTORY.size() * self.header.NumberOfStreams)
+		assert current_file_offset == self.header.StreamDirectoryRva
 
+		self.directories = []
 		for stream_type in self.stream_to_handler:
-			current_directory = MINIDUMP_DIRECTORY(current_file_offset, self._file)
+			current_directory = MINIDUMP_DIRECTORY(current_file_offset, self._layout)
 			current_directory.StreamType = stream_type
 			current_directory.write()
+			self.directories.append(current_directory)
 			current_file_offset += current_directory.size()
 
 	def _alloc(self, amount):
-		self._file.seek(0, 2)
-		current_position = self._file.tell()
-		self._file.seek(amount - 1, 1)
-		self._file.write(b"\x00")
+		allocated_location = self._end_rva
+		self._end_rva += amount
 
-		return current_position
+		return allocated_location
 
 	def _alloc_buffer(self, buffer):
 		allocated_location = self._alloc(len(buffer))
-		self._file.seek(allocated_location)
-		self._file.write(buffer)
+		self._layout.seek(allocated_location)
+		self._layout.write(buffer)
 
 		return allocated_location
 
@@ -366,17 +1332,478 @@ class minidump_writer:
 
 		return self._alloc_buffer(bytes(minidump_string) + string_encoded)
 
+	def _emit(self, buffer):
+		view = memoryview(buffer).cast("B")
+		while len(view) > 0:
+			written = self._file_write(view)
+			if written is None:
+				# sendall and most wrappers report nothing and consume the whole buffer
+				written = len(view)
+
+			view = view[written:]
+			self._file_offset += written
+
+	def _copy_file_backing(self, disk_rva, file_backing, size):
+		"""
+		copies a file backed range inside the kernel, returns False when the output can't be copied to
+		"""
+		source_fd, source_offset = file_backing
+		output_fd = self._fd
+		if output_fd is None:
+			# zero page detection needs the bytes
+			if self._sparse or disk_rva != self._file_offset:
+				return False
+
+			try:
+				self._file.flush()
+				output_fd = self._file.fileno()
+			except (AttributeError, OSError, io.UnsupportedOperation):
+				self._kernel_copy_supported = False
+				return False
+
+		if self.io_scheduler is not None:
+			self.io_scheduler.reserve_write(size)
+
+		copied = 0
+		while copied < size:
+			try:
+				if self._fd is not None:
+					amount_copied = os.copy_file_range(source_fd, output_fd, size - copied, source_offset + copied, disk_rva + copied)
+				elif self._use_copy_file_range:
+					# the output file offset is used and advanced, it is kept in sync with _file_offset
+					amount_copied = os.copy_file_range(source_fd, output_fd, size - copied, source_offset + copied)
+				else:
+					amount_copied = os.sendfile(output_fd, source_fd, source_offset + copied, size - copied)
+			except (AttributeError, OSError) as e:
+				if copied > 0 or getattr(e, "errno", None) not in (None, errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EBADF, errno.EOPNOTSUPP):
+					raise
+
+				if self._fd is None and self._use_copy_file_range:
+					# pipes and sockets only work with sendfile
+					self._use_copy_file_range = False
+					continue
+
+				self._kernel_copy_supported = False
+				return False
+
+			if amount_copied == 0:
+				raise RuntimeError(f"File backing of {size:#x} bytes at {source_offset:#x} ended after {copied:#x} bytes")
+
+			copied += amount_copied
+			if self._fd is None:
+				self._file_offset += amount_copied
+
+		return True
+
+	def _pwrite(self, rva, buffer):
+		view = memoryview(buffer).cast("B")
+		while len(view) > 0:
+			written = os.pwrite(self._fd, view, rva)
+			view = view[written:]
+			rva += written
+
+	def _write_at(self, rva, buffer):
+		if self.io_scheduler is not None:
+			self.io_scheduler.reserve_write(len(buffer))
+
+		if self.instrumentation is not None:
+			write_start = time.perf_counter()
+
+		if self._output_map_view is not None:
+			self._output_map_view[rva:rva + len(buffer)] = buffer
+		elif self._sparse:
+			self._write_nonzero_pages(rva, buffer)
+		else:
+			self._write_range(rva, buffer)
+
+		if self.instrumentation is not None:
+			self.instrumentation.record_write(time.perf_counter() - write_start, len(buffer))
+
+		if self._journal is not None:
+			self._journal.record(rva, len(buffer))
+
+	def _write_range(self, rva, buffer):
+		if self._fd is not None:
+			self._pwrite(rva, buffer)
+			return
+
+		if rva != self._file_offset:
+			# zero pages skipped by the sparse writer and ranges written by a resumed run are the only gaps allowed
+			if not (self._sparse or self._resuming) or rva < self._file_offset:
+				raise RuntimeError(f"Out of order write at {rva:#x}, file is at {self._file_offset:#x}")
+
+			self._file.seek(rva)
+			self._file_offset = rva
+
+		self._emit(buffer)
+
+	def _write_nonzero_pages(self, rva, buffer):
+		view = memoryview(buffer).cast("B")
+		pending_start = 0
+		skipped = 0
+
+		# pages are aligned on the file offset so skipped pages line up with filesystem blocks
+		page_offset = -rva % SPARSE_PAGE_SIZE
+		while page_offset + SPARSE_PAGE_SIZE <= len(view):
+			page_end = page_offset + SPARSE_PAGE_SIZE
+			if view[page_offset:page_end].tobytes() == _ZERO_PAGE:
+				if pending_start < page_offset:
+					self._write_range(rva + pending_start, view[pending_start:page_offset])
+
+				pending_start = page_end
+				skipped += SPARSE_PAGE_SIZE
+
+			page_offset = page_end
+
+		if pending_start < len(view):
+			self._write_range(rva + pending_start, view[pending_start:])
+
+		if skipped:
+			with self._sparse_lock:
+				self.sparse_bytes_skipped += skipped
+
+	def _preallocate(self, size):
+		"""
+		reserves the whole dump at once so the filesystem can allocate it contiguously
+		"""
+		if self._sparse:
+			logging.warning("Preallocating would fill the holes of sparse output, not preallocating")
+			return
+
+		if self._file is not self._output_file or not hasattr(os, "posix_fallocate"):
+			return
+
+		try:
+			self._file.flush()
+			os.posix_fallocate(self._file.fileno(), 0, size)
+		except (AttributeError, io.UnsupportedOperation):
+			# pipes and sockets have nothing to preallocate
+			pass
+		except OSError as e:
+			if e.errno not in (errno.EINVAL, errno.EOPNOTSUPP, errno.ENODEV, errno.ESPIPE):
+				raise
+
+			logging.warning(f"Could not preallocate the dump: {e}")
+
+	def _map_output(self):
+		"""
+		maps the whole dump once everything before the payload was written, the payload is then filled in place
+		"""
+		if self._memory64_payload_size == 0:
+			return
+
+		try:
+			self._file.flush()
+			fileno = self._file.fileno()
+		except (AttributeError, OSError, io.UnsupportedOperation):
+			logging.warning("Memory mapped output needs a file with fileno(), writing the payload instead")
+			return
+
+		try:
+			output_stat = os.fstat(fileno)
+			if not stat.S_ISREG(output_stat.st_mode):
+				logging.warning("Memory mapped output needs a regular file, writing the payload instead")
+				return
+
+			if output_stat.st_size < self._end_rva:
+				os.ftruncate(fileno, self._end_rva)
+
+			try:
+				self._output_map = mmap.mmap(fileno, self._end_rva)
+			except PermissionError:
+				# a file opened "wb" can't be mapped for writing. the kernel link of the fd opens the same file
+				# read-write (not its name, which may be an fd number or point elsewhere by now)
+				reopen_path = f"/proc/self/fd/{fileno}"
+				if not os.path.exists(reopen_path):
+					raise PermissionError("the dump is write-only, open it with \"w+b\" to map it") from None
+
+				map_fd = os.open(reopen_path, os.O_RDWR)
+				try:
+					self._output_map = mmap.mmap(map_fd, self._end_rva)
+				finally:
+					os.close(map_fd)
+		except (OSError, ValueError) as e:
+			logging.warning(f"Could not map the dump, writing the payload instead: {e}")
+			self._output_map = None
+			return
+
+		self._output_map_view = memoryview(self._output_map)
+
+	def _unmap_output(self):
+		if self._output_map is None:
+			return
+
+		# providers must not keep slices of the map, closing it fails otherwise
+		self._output_map_view.release()
+		self._output_map_view = None
+		self._output_map.close()
+		self._output_map = None
+
+	def _emit_layout(self, size):
+		layout = self._layout.getvalue()
+		self._emit(layout)
+		if len(layout) < size:
+			self._emit(bytes(size - len(layout)))
+
 	def write_directories(self):
-		for stream_index in range(self.header.NumberOfStreams):
-			directory_offset = self.header.StreamDirectoryRva + (stream_index) * MINIDUMP_DIRECTORY.size()
-			directory = MINIDUMP_DIRECTORY(directory_offset, self._file, True)
-			info_getter, translator, post_translator = self.stream_to_handler[directory.StreamType]
-			info = info_getter()
-			location = translator(info)
-
-			directory.Location = location
-			directory.write()
+		# gather everything from the provider before a single RVA is assigned
+		stream_infos = []
+		for directory in self.directories:
+			info_getter, _, _ = self.stream_to_handler[directory.StreamType]
+			stream_infos.append(self._instrumented(directory.StreamType, "enumerate", info_getter))
+
+		if self.thread_stacks:
+			for thread_id, stack_start, stack_size, info in self._resolve_thread_stacks(stream_infos):
+				self._thread_stacks[thread_id] = (stack_start, stack_size, self._get_bytes_exact(stack_start, stack_size, info))
 
+		self._select_memory(stream_infos)
+		if self.probe_memory:
+			self._probe_memory(stream_infos)
+
+		self._lay_out_streams(stream_infos)
+
+		for directory, info in zip(self.directories, stream_infos):
+			_, _, post_translator = self.stream_to_handler[directory.StreamType]
 			if post_translator:
-				post_translator(info, directory)
+				self._instrumented(directory.StreamType, "post", post_translator, info, directory)
+
+	def _instrumented(self, stream_type, phase, function, *args):
+		if self.instrumentation is None:
+			return function(*args)
+
+		phase_start = time.perf_counter()
+		try:
+			return function(*args)
+		finally:
+			self.instrumentation.record_stream(stream_type, phase, time.perf_counter() - phase_start)
+
+	def _gathered_stream_info(self, stream_infos, stream_type, getter):
+		# reuse what was gathered for the stream instead of asking the provider twice
+		for directory, info in zip(self.directories, stream_infos):
+			if directory.StreamType == stream_type.value:
+				return info
+
+		return getter()
+
+	def _gathered_arch(self, stream_infos):
+		# the layout runs before SystemInfoStream is translated, self.arch isn't set yet
+		system_info = self._gathered_stream_info(stream_infos, MINIDUMP_STREAM_TYPE.SystemInfoStream, self.get_system_info)
+		return arch_to_ProcessorArchitecture.get(system_info["ProcessorArchitecture"], ProcessorArchitecture.PROCESSOR_ARCHITECTURE_UNKNOWN.value)
+
+	def _resolve_thread_stacks(self, stream_infos):
+		"""
+		returns (thread_id, stack_start, stack_size, info) for every thread with a dumped stack, stacks are
+		cut at the end of the memory descriptor they start in
+		"""
+		thread_stacks = []
+		threads = self._gathered_stream_info(stream_infos, MINIDUMP_STREAM_TYPE.ThreadListStream, self.get_threads)
+		memory_descriptors = self._gathered_stream_info(stream_infos, MINIDUMP_STREAM_TYPE.Memory64ListStream, self.get_memory_descriptors)
+		descriptors = sorted(iter_fetch_ranges(memory_descriptors), key=lambda descriptor: descriptor[0])
+		descriptor_starts = [range_start for range_start, _, _ in descriptors]
+		arch = self._gathered_arch(stream_infos)
+
+		for thread_id, thread_info in threads.items():
+			if "Stack" in thread_info:
+				stack_start, stack_size = thread_info["Stack"]
+			else:
+				stack_pointer = context_stack_pointer(thread_info.get("Context", None), arch)
+				if stack_pointer is None:
+					continue
 
+				stack_start = stack_pointer // SPARSE_PAGE_SIZE * SPARSE_PAGE_SIZE
+				stack_size = MAX_STACK_SIZE
+
+			descriptor_index = bisect.bisect_right(descriptor_starts, stack_start) - 1
+			if descriptor_index < 0:
+				continue
+
+			range_start, range_size, info = descriptors[descriptor_index]
+			stack_size = min(stack_size, range_start + range_size - stack_start)
+			if stack_size > 0:
+				thread_stacks.append((thread_id, stack_start, stack_size, info))
+
+		return thread_stacks
+
+	def _memory_stream_index(self):
+		stream_types = [directory.StreamType for directory in self.directories]
+		if MINIDUMP_STREAM_TYPE.Memory64ListStream.value not in stream_types:
+			return None
+
+		return stream_types.index(MINIDUMP_STREAM_TYPE.Memory64ListStream.value)
+
+	def _select_memory(self, stream_infos):
+		"""
+		replaces the memory descriptors in stream_infos by the parts the preset and memory_filters keep
+		"""
+		if self.preset is None and not self.memory_filters:
+			return
+
+		memory_index = self._memory_stream_index()
+		if memory_index is None:
+			return
+
+		if self.thread_stacks and self.preset is not None and self.preset.stacks_only:
+			# the stacks are in the MemoryListStream already
+			stream_infos[memory_index] = []
+			return
+
+		memory_info = self._gathered_stream_info(stream_infos, MINIDUMP_STREAM_TYPE.MemoryInfoListStream, self.get_memory_info)
+		modules = self._gathered_stream_info(stream_infos, MINIDUMP_STREAM_TYPE.ModuleListStream, self.get_modules)
+		threads = self._gathered_stream_info(stream_infos, MINIDUMP_STREAM_TYPE.ThreadListStream, self.get_threads)
+
+		stream_infos[memory_index] = select_memory(stream_infos[memory_index], memory_info, modules, threads, self.preset or dump_presets["full"], self.memory_filters, self._gathered_arch(stream_infos))
+
+	def _probe_memory(self, stream_infos):
+		"""
+		replaces the memory descriptors in stream_infos by their readable parts
+		"""
+		memory_index = self._memory_stream_index()
+		if memory_index is None:
+			return
+
+		ranges = list(iter_fetch_ranges(stream_infos[memory_index]))
+		readable_parts = []
+		for range_start, range_size, info in ranges:
+			range_readable_parts = self.probe_readable(range_start, range_size, info)
+			if range_readable_parts is None:
+				range_readable_parts = self._readable_parts(range_start, range_size, info)
+
+			readable_parts.append(range_readable_parts)
+
+		stream_infos[memory_index] = self._probed_descriptors(ranges, readable_parts)
+
+	def _probed_descriptors(self, ranges, readable_parts):
+		"""
+		the descriptor list of the readable parts of every (range_start, range_size, info) in ranges
+		"""
+		probed = []
+		self.probed_out_bytes = 0
+		for (range_start, range_size, info), range_readable_parts in zip(ranges, readable_parts):
+			for part_start, part_size in range_readable_parts:
+				probed.append((part_start, part_size, info))
+				range_size -= part_size
+
+			self.probed_out_bytes += range_size
+
+		if self.probed_out_bytes:
+			logging.info(f"Probing left {self.probed_out_bytes:#x} unreadable bytes out of the dump")
+
+		return coalesce_ranges(probed)
+
+	def _readable_parts(self, address, size, info):
+		"""
+		reads the range chunk by chunk, returns its readable (address, size) parts
+		"""
+		readable_parts = []
+		for chunk_address, chunk_size in self._probe_chunks(address, size):
+			if self.throttle is not None:
+				self.throttle.wait(chunk_size)
+
+			for part_address, part_size, data in self._read_salvaging(chunk_address, chunk_size, info):
+				_add_readable_part(readable_parts, part_address, part_size, data)
+
+		return readable_parts
+
+	def _probe_chunks(self, address, size):
+		offset = 0
+		while offset < size:
+			chunk_size = self._next_chunk_size(size - offset)
+			yield address + offset, chunk_size
+			offset += chunk_size
+
+	def _translate_streams(self, stream_infos):
+		"""
+		translates every stream into the layout and assigns the payload its RVA, returns the size of
+		everything before the payload
+		"""
+		for directory, info in zip(self.directories, stream_infos):
+			_, translator, _ = self.stream_to_handler[directory.StreamType]
+			stream_start = self._end_rva
+			directory.Location = self._instrumented(directory.StreamType, "serialize", translator, info)
+			directory.write()
+			self._stream_sizes[directory.StreamType] = self._end_rva - stream_start
+
+		# the memory payload goes after every other stream so it can be streamed in last
+		if self._sparse:
+			# page align the payload so zero pages map to whole filesystem blocks
+			self._alloc(-self._end_rva % SPARSE_PAGE_SIZE)
+
+		metadata_size = self._end_rva
+		if self._memory64_list_struct is not None:
+			self._memory64_list_struct.BaseRva = self._alloc(self._memory64_payload_size)
+			self._memory64_list_struct.write()
+
+		return metadata_size
+
+	def _lay_out_streams(self, stream_infos):
+		"""
+		translates every stream into the layout and emits everything before the memory payload
+		"""
+		metadata_size = self._translate_streams(stream_infos)
+		if self._journal is not None and self.resume:
+			self._resume_layout(metadata_size)
+			if self._mmap_output:
+				self._map_output()
+
+			if self.instrumentation is not None:
+				self.instrumentation.begin_payload(self._memory64_payload_size - self._journal.completed_bytes)
+			return
+
+		if self.preallocate or self._mmap_output:
+			self._preallocate(self._end_rva)
+
+		if self.instrumentation is not None:
+			layout_start = time.perf_counter()
+			self._emit_layout(metadata_size)
+			self.instrumentation.record_write(time.perf_counter() - layout_start, metadata_size, payload=False)
+			self.instrumentation.begin_payload(self._memory64_payload_size)
+		else:
+			self._emit_layout(metadata_size)
+
+		if self._sparse:
+			# the final length is known, skipped pages at the end of the payload become holes as well
+			self._file.truncate(self._end_rva)
+
+		if self._journal is not None:
+			layout = self._layout.getbuffer()[:metadata_size]
+			metadata_crc = zlib.crc32(bytes(metadata_size - len(layout)), zlib.crc32(layout))
+			layout.release()
+			payload_rva = self._memory64_list_struct.BaseRva if self._memory64_list_struct is not None else self._end_rva
+			self._journal.begin(self.header.TimeDateStamp, metadata_size, metadata_crc, payload_rva, self._memory64_payload_size, self._sync_output)
+
+		if self._mmap_output:
+			self._map_output()
+
+	def _resume_layout(self, metadata_size):
+		"""
+		checks the dump written by the failed run against the layout instead of writing it again. the header,
+		the directory and the memory list have to match, the other streams keep what the failed run wrote
+		"""
+		payload_rva = self._memory64_list_struct.BaseRva if self._memory64_list_struct is not None else self._end_rva
+		if (metadata_size, payload_rva, self._memory64_payload_size) != (self._journal.metadata_size, self._journal.payload_rva, self._journal.payload_size):
+			raise ValueError("The layout changed since the failed write, the dump can't be resumed")
+
+		try:
+			self._file.seek(0)
+			written_metadata = self._file.read(metadata_size)
+		except (AttributeError, io.UnsupportedOperation):
+			raise ValueError("Resuming needs the partial dump opened for reading and writing (\"r+b\")") from None
+
+		if len(written_metadata) != metadata_size or zlib.crc32(written_metadata) != self._journal.metadata_crc:
+			raise ValueError("The dump does not start with the metadata recorded in the journal")
+
+		layout = self._layout.getvalue()
+		checked_ranges = [(0, self.header.StreamDirectoryRva + MINIDUMP_DIRECTORY.size() * self.header.NumberOfStreams)]
+		for directory in self.directories:
+			if directory.StreamType == MINIDUMP_STREAM_TYPE.Memory64ListStream.value:
+				checked_ranges.append((directory.Location.Rva, directory.Location.Rva + directory.Location.DataSize))
+
+		for checked_start, checked_end in checked_ranges:
+			if written_metadata[checked_start:checked_end] != layout[checked_start:checked_end]:
+				raise ValueError(f"The dump differs from the layout at {checked_start:#x}, the provider changed since the failed write")
+
+		self._journal.resume(self._sync_output)
+		self._resuming = True
+		self._file_offset = metadata_size
+		# zero pages are written as well, a chunk the failed run did not finish may have left data in them
+		self._sparse = False
@@ -21,5 +21,5 @@ setup(name='minidumpwriter',
       author='Paul Kermann',
       author_email='paulkermann@tutanota.com',
       url='https://github.com/paulkermann/MinidumpWriter',
-      py_modules=['minidump_writer', 'minidump_structs', 'minidump_enums'],
+      py_modules=['minidump_writer', 'minidump_structs', 'minidump_enums', 'minidump_columns', 'minidump_delta', 'minidump_compress', 'minidump_presets', 'minidump_instrumentation', 'minidump_journal', 'minidump_batch', 'minidump_throttle', 'minidump_reader', 'async_minidump_writer'],
      )
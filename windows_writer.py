@@ -1,8 +1,13 @@
 from minidump_enums import *
-from minidump_writer import minidump_provider, minidump_writer
+from minidump_writer import minidump_provider, minidump_writer, unreadable_memory_error
 import windows
+import ctypes
+import struct
 import sys
 
+PAGE_NOACCESS = 0x01
+PAGE_GUARD = 0x100
+
 def windows_protect_to_string(protect):
 	to_return = ""
 	if "READ" in str(protect):
@@ -87,12 +92,43 @@ class windows_writer(minidump_provider, minidump_writer):
 
 			thread_info["Context"] = context
 
+			stack = self._thread_stack(thread.teb_base, context.get("Rsp", context.get("Esp", 0)))
+			if stack is not None:
+				thread_info["Stack"] = stack
+
 			threads[thread.tid] = thread_info
 
 		return threads
 
-	def get_memory_info(self):
-		memory_info = []
+	def _thread_stack(self, teb_base, stack_pointer):
+		"""
+		(start, size) of the used part of the stack, bounded by StackLimit and StackBase of the TEB's NT_TIB
+		"""
+		pointer_size = 8
+		if self.process.is_wow_64:
+			# the 32 bit TEB follows the 64 bit one
+			teb_base += 0x2000
+			pointer_size = 4
+		elif windows.system.bitness == 32:
+			pointer_size = 4
+
+		try:
+			nt_tib = self.process.read_memory(teb_base, 3 * pointer_size)
+		except:
+			return None
+
+		_, stack_base, stack_limit = struct.unpack("<3Q" if pointer_size == 8 else "<3I", nt_tib)
+		stack_start = stack_limit
+		if stack_limit <= stack_pointer < stack_base:
+			stack_start = stack_pointer & ~0xfff
+
+		if stack_start >= stack_base:
+			return None
+
+		return stack_start, stack_base - stack_start
+
+	def _committed_regions(self):
+		committed_regions = []
 		for basic_info in self.process.memory_state():
 			to_skip = False
 			skip_states = [0x2000, 0x10000] # skip free and reserved
@@ -104,6 +140,17 @@ class windows_writer(minidump_provider, minidump_writer):
 			if to_skip:
 				continue
 
+			committed_regions.append(basic_info)
+
+		return committed_regions
+
+	def take_snapshot(self):
+		# memory_state() walks the whole address space, walk it once for both memory streams
+		return self._committed_regions()
+
+	def get_memory_info(self):
+		memory_info = []
+		for basic_info in self.snapshot or self._committed_regions():
 			info = {}
 			info["BaseAddress"] = basic_info.BaseAddress
 			info["RegionSize"] = basic_info.RegionSize
@@ -124,31 +171,48 @@ class windows_writer(minidump_provider, minidump_writer):
 
 	def get_memory_descriptors(self):
 		memory_descriptors_arr = []
-
-		for basic_info in self.process.memory_state():
-			to_skip = False
-			skip_states = [0x2000, 0x10000] # skip free and reserved
-			for skip_state in skip_states:
-				if basic_info.State & skip_state == skip_state:
-					to_skip = True
-					break
-
-			if to_skip:
-				continue
-			
+		for basic_info in self.snapshot or self._committed_regions():
 			memory_descriptors_arr.append((basic_info.BaseAddress, basic_info.RegionSize, basic_info))
 
 		return memory_descriptors_arr
 
+	def probe_readable(self, address, size, info):
+		# guard pages fault on the first read and lose their guard, they are left out without being touched
+		if int(info.Protect) & (PAGE_GUARD | PAGE_NOACCESS):
+			return []
+
+		return [(address, size)]
+
 	def get_bytes(self, address, size, info):
 		try:
 			return self.process.read_memory(address, size)
-		except:
-			return b"\x00" * size
+		except Exception as e:
+			# ReadProcessMemory fails the whole read for a single bad page, the writer salvages the rest
+			raise unreadable_memory_error(address, size) from e
+
+	def get_bytes_into(self, address, buffer, info):
+		size = len(buffer)
+		buffer_address = ctypes.addressof((ctypes.c_char * size).from_buffer(buffer))
+		try:
+			self.process.low_read_memory(address, buffer_address, size)
+		except Exception as e:
+			raise unreadable_memory_error(address, size) from e
+
+		return size
 
 def main():
 	pid = int(sys.argv[1])
-	with open(f"windows_writer_{pid}.dmp", "wb+") as f:
+	output_path = f"windows_writer_{pid}.dmp"
+	if len(sys.argv) > 2:
+		output_path = sys.argv[2]
+
+	# "-" streams the dump to stdout so it can be piped without a temporary file
+	if output_path == "-":
+		test_writer = windows_writer(sys.stdout.buffer, pid=pid)
+		test_writer.write()
+		return
+
+	with open(output_path, "wb") as f:
 		test_writer = windows_writer(f, pid=pid)
 		test_writer.write()
 